@@ -8,12 +8,105 @@ SQL AST 解析器
 import os
 import sys
 import json
+import math
 
 # 实现一个基础的SQL解析器
 class SimpleSQLParser:
-    def __init__(self):
+    # 词法规则（按优先级排列），首次使用时合并为一个正则并只编译一次
+    TOKEN_PATTERNS = [
+        (r'\bSELECT\b', 'SELECT'),
+        (r'\bFROM\b', 'FROM'),
+        (r'\bWHERE\b', 'WHERE'),
+        (r'\bAND\b', 'AND'),
+        (r'\bOR\b', 'OR'),
+        (r'\bINSERT\b', 'INSERT'),
+        (r'\bINTO\b', 'INTO'),
+        (r'\bVALUES\b', 'VALUES'),
+        (r'\bUPDATE\b', 'UPDATE'),
+        (r'\bSET\b', 'SET'),
+        (r'\bDELETE\b', 'DELETE'),
+        (r'\bCREATE\b', 'CREATE'),
+        (r'\bTABLE\b', 'TABLE'),
+        (r'\bDROP\b', 'DROP'),
+        (r'\bJOIN\b', 'JOIN'),
+        (r'\bINNER\b', 'INNER'),
+        (r'\bLEFT\b', 'LEFT'),
+        (r'\bRIGHT\b', 'RIGHT'),
+        (r'\bON\b', 'ON'),
+        (r'\bGROUP\b', 'GROUP'),
+        (r'\bBY\b', 'BY'),
+        (r'\bORDER\b', 'ORDER'),
+        (r'\bHAVING\b', 'HAVING'),
+        (r'\bLIMIT\b', 'LIMIT'),
+        (r'\bAS\b', 'AS'),
+        (r'\bDISTINCT\b', 'DISTINCT'),
+        (r'\bNULL\b', 'NULL'),
+        (r'\bNOT\b', 'NOT'),
+        (r'\bIS\b', 'IS'),
+        (r'\bLIKE\b', 'LIKE'),
+        (r'\bIN\b', 'IN'),
+        (r'\bBETWEEN\b', 'BETWEEN'),
+        (r'\bCOUNT\b', 'COUNT'),
+        (r'\bSUM\b', 'SUM'),
+        (r'\bAVG\b', 'AVG'),
+        (r'\bMAX\b', 'MAX'),
+        (r'\bMIN\b', 'MIN'),
+        (r'>=', 'GE'),
+        (r'<=', 'LE'),
+        (r'<>', 'NE'),
+        (r'!=', 'NE'),
+        (r'=', 'EQ'),
+        (r'<', 'LT'),
+        (r'>', 'GT'),
+        (r'\+', 'PLUS'),
+        (r'-', 'MINUS'),
+        (r'\*', 'MULTIPLY'),
+        (r'/', 'DIVIDE'),
+        (r'%', 'MOD'),
+        (r';', 'SEMICOLON'),
+        (r',', 'COMMA'),
+        (r'\(', 'LPAREN'),
+        (r'\)', 'RPAREN'),
+        (r'\.', 'DOT'),
+        (r"'[^']*'", 'STRING'),
+        (r'`[^`]*`', 'BACKTICK_IDENTIFIER'),
+        (r'\d+\.\d+', 'DECIMAL'),
+        (r'\d+', 'INTEGER'),
+        (r'[a-zA-Z_][a-zA-Z0-9_]*', 'IDENTIFIER'),
+    ]
+    _token_regex = None
+
+    # 分析级别：tokens 只做词法分析；ast 只生成语法树；ast+plan 再生成执行计划；
+    # full（默认）在此基础上附带各子句的说明文字和结构哈希，与原有输出一致
+    ANALYSIS_LEVELS = ('tokens', 'ast', 'ast+plan', 'full')
+    
+    def __init__(self, interner=None, level='full'):
+        self.check_level(level)
         self.tokens = []
         self.current = 0
+        # 传入 NodeInterner 时开启叶子节点驻留，解析结果按只读约定使用
+        self.interner = interner
+        self.level = level
+        self.with_plan = level in ('ast+plan', 'full')
+        self.with_descriptions = level == 'full'
+        # 驻留的共享节点本身带结构哈希，开启驻留时语法树级别也计算哈希，保证整棵树一致
+        self.with_hashes = level == 'full' or (interner is not None and level != 'tokens')
+    
+    @classmethod
+    def check_level(cls, level):
+        """校验分析级别，未知级别抛出 ValueError（命令行入口据此输出错误信息）"""
+        if level not in cls.ANALYSIS_LEVELS:
+            raise ValueError(f"未知的分析级别 {level}（可选：{', '.join(cls.ANALYSIS_LEVELS)}）")
+        return level
+
+    @classmethod
+    def token_regex(cls):
+        """返回合并后的词法正则（进程内只编译一次）"""
+        if cls._token_regex is None:
+            import re
+            combined = '|'.join(f'({pattern})' for pattern, _ in cls.TOKEN_PATTERNS)
+            cls._token_regex = re.compile(combined, re.IGNORECASE)
+        return cls._token_regex
     
     def tokenize(self, sql):
         """简单的词法分析"""
@@ -22,68 +115,8 @@ class SimpleSQLParser:
         sql = re.sub(r'--.*?\n', ' ', sql)
         sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.DOTALL)
         
-        # 定义token模式
-        patterns = [
-            (r'\bSELECT\b', 'SELECT'),
-            (r'\bFROM\b', 'FROM'),
-            (r'\bWHERE\b', 'WHERE'),
-            (r'\bAND\b', 'AND'),
-            (r'\bOR\b', 'OR'),
-            (r'\bINSERT\b', 'INSERT'),
-            (r'\bINTO\b', 'INTO'),
-            (r'\bVALUES\b', 'VALUES'),
-            (r'\bUPDATE\b', 'UPDATE'),
-            (r'\bSET\b', 'SET'),
-            (r'\bDELETE\b', 'DELETE'),
-            (r'\bCREATE\b', 'CREATE'),
-            (r'\bTABLE\b', 'TABLE'),
-            (r'\bDROP\b', 'DROP'),
-            (r'\bJOIN\b', 'JOIN'),
-            (r'\bINNER\b', 'INNER'),
-            (r'\bLEFT\b', 'LEFT'),
-            (r'\bRIGHT\b', 'RIGHT'),
-            (r'\bON\b', 'ON'),
-            (r'\bGROUP\b', 'GROUP'),
-            (r'\bBY\b', 'BY'),
-            (r'\bORDER\b', 'ORDER'),
-            (r'\bHAVING\b', 'HAVING'),
-            (r'\bLIMIT\b', 'LIMIT'),
-            (r'\bAS\b', 'AS'),
-            (r'\bDISTINCT\b', 'DISTINCT'),
-            (r'\bNULL\b', 'NULL'),
-            (r'\bNOT\b', 'NOT'),
-            (r'\bIS\b', 'IS'),
-            (r'\bLIKE\b', 'LIKE'),
-            (r'\bIN\b', 'IN'),
-            (r'\bBETWEEN\b', 'BETWEEN'),
-            (r'\bCOUNT\b', 'COUNT'),
-            (r'\bSUM\b', 'SUM'),
-            (r'\bAVG\b', 'AVG'),
-            (r'\bMAX\b', 'MAX'),
-            (r'\bMIN\b', 'MIN'),
-            (r'>=', 'GE'),
-            (r'<=', 'LE'),
-            (r'<>', 'NE'),
-            (r'!=', 'NE'),
-            (r'=', 'EQ'),
-            (r'<', 'LT'),
-            (r'>', 'GT'),
-            (r'\+', 'PLUS'),
-            (r'-', 'MINUS'),
-            (r'\*', 'MULTIPLY'),
-            (r'/', 'DIVIDE'),
-            (r'%', 'MOD'),
-            (r';', 'SEMICOLON'),
-            (r',', 'COMMA'),
-            (r'\(', 'LPAREN'),
-            (r'\)', 'RPAREN'),
-            (r'\.', 'DOT'),
-            (r"'[^']*'", 'STRING'),
-            (r'`[^`]*`', 'BACKTICK_IDENTIFIER'),
-            (r'\d+\.\d+', 'DECIMAL'),
-            (r'\d+', 'INTEGER'),
-            (r'[a-zA-Z_][a-zA-Z0-9_]*', 'IDENTIFIER'),
-        ]
+        regex = self.token_regex()
+        token_types = [token_type for _, token_type in self.TOKEN_PATTERNS]
         
         tokens = []
         pos = 0
@@ -92,24 +125,19 @@ class SimpleSQLParser:
             if sql[pos].isspace():
                 pos += 1
                 continue
-                
-            matched = False
-            for pattern, token_type in patterns:
-                regex = re.compile(pattern, re.IGNORECASE)
-                match = regex.match(sql, pos)
-                if match:
-                    value = match.group(0)
-                    tokens.append({
-                        'type': token_type,
-                        'value': value,
-                        'start': pos,
-                        'end': pos + len(value)
-                    })
-                    pos = match.end()
-                    matched = True
-                    break
             
-            if not matched:
+            # 各规则是按顺序排列的分支，命中的分组序号即规则序号
+            match = regex.match(sql, pos)
+            if match:
+                value = match.group(0)
+                tokens.append({
+                    'type': token_types[match.lastindex - 1],
+                    'value': value,
+                    'start': pos,
+                    'end': pos + len(value)
+                })
+                pos = match.end()
+            else:
                 pos += 1  # 跳过无法识别的字符
         
         return tokens
@@ -118,15 +146,25 @@ class SimpleSQLParser:
         """解析SQL并生成AST"""
         self.tokens = self.tokenize(sql)
         self.current = 0
+
+        if self.level == 'tokens':
+            # 词法单元直接作为子节点返回，不构建语法树
+            return {'type': 'token_stream', 'children': self.tokens}
         
         if not self.tokens:
-            return {'type': 'root', 'children': []}
-        
-        try:
-            return self.parse_statement()
-        except Exception as e:
-            print(f"解析错误: {e}")
-            return {'type': 'error', 'message': str(e), 'children': []}
+            ast = {'type': 'root', 'children': []}
+        else:
+            try:
+                ast = self.parse_statement()
+            except Exception as e:
+                print(f"解析错误: {e}")
+                ast = {'type': 'error', 'message': str(e), 'children': []}
+        
+        if self.interner is not None:
+            self.interner.intern_tree(ast)
+        if self.with_hashes:
+            compute_node_hashes(ast)
+        return ast
     
     def current_token(self):
         if self.current < len(self.tokens):
@@ -166,23 +204,12 @@ class SimpleSQLParser:
             return {'type': 'unknown_statement', 'value': token['value'], 'children': []}
     
     def parse_select(self):
-        """解析SELECT语句，生成AST和执行计划"""
+        """解析SELECT语句，生成AST和执行计划（ast 级别只生成AST）"""
         # 生成AST（语法结构）
-        ast_result = {
-            'type': 'select_statement',
-            'description': 'SQL查询语句的抽象语法树表示',
-            'children': []
-        }
+        ast_result = self.make_node('select_statement', 'SQL查询语句的抽象语法树表示', [])
         
-        # 生成执行计划（逻辑执行顺序）
-        execution_plan = {
-            'type': 'execution_plan',
-            'description': 'SQL查询的逻辑执行计划',
-            'children': []
-        }
-        
-        # 存储各个子句用于执行计划排序
-        clauses = {}
+        # 存储各个子句用于执行计划排序；ast 级别不生成执行计划
+        clauses = {} if self.with_plan else None
         
         # 解析SELECT关键字
         if self.current_token() and self.current_token()['type'] == 'SELECT':
@@ -195,12 +222,8 @@ class SimpleSQLParser:
                 'children': [select_list]
             }
             ast_result['children'].append(select_expr_list)
-            clauses['SELECT'] = {
-                'type': 'select_operation',
-                'execution_order': 5,
-                'description': '选择指定的列或表达式',
-                'children': [select_list]
-            }
+            if clauses is not None:
+                clauses['SELECT'] = self.make_plan_step('select_operation', 5, '选择指定的列或表达式', [select_list])
             
             # 解析FROM子句
             if self.current_token() and self.current_token()['type'] == 'FROM':
@@ -210,12 +233,8 @@ class SimpleSQLParser:
                     'children': [from_clause]
                 }
                 ast_result['children'].append(table_references)
-                clauses['FROM'] = {
-                    'type': 'table_scan',
-                    'execution_order': 1,
-                    'description': '扫描基础表，建立工作集',
-                    'children': [from_clause]
-                }
+                if clauses is not None:
+                    clauses['FROM'] = self.make_plan_step('table_scan', 1, '扫描基础表，建立工作集', [from_clause])
             
             # 解析JOIN子句
             join_clauses = []
@@ -230,12 +249,8 @@ class SimpleSQLParser:
                     'children': join_clauses
                 }
                 ast_result['children'].append(joined_table)
-                clauses['JOIN'] = {
-                    'type': 'join_operation',
-                    'execution_order': 2,
-                    'description': '执行表连接操作',
-                    'children': join_clauses
-                }
+                if clauses is not None:
+                    clauses['JOIN'] = self.make_plan_step('join_operation', 2, '执行表连接操作', join_clauses)
             
             # 解析WHERE子句
             if self.current_token() and self.current_token()['type'] == 'WHERE':
@@ -245,12 +260,8 @@ class SimpleSQLParser:
                     'children': [where_clause]
                 }
                 ast_result['children'].append(where_expr)
-                clauses['WHERE'] = {
-                    'type': 'filter_operation',
-                    'execution_order': 3,
-                    'description': '过滤不符合条件的行',
-                    'children': [where_clause]
-                }
+                if clauses is not None:
+                    clauses['WHERE'] = self.make_plan_step('filter_operation', 3, '过滤不符合条件的行', [where_clause])
             
             # 解析GROUP BY子句
             if (self.current_token() and self.current_token()['type'] == 'GROUP' and
@@ -261,12 +272,8 @@ class SimpleSQLParser:
                     'children': [group_by_clause]
                 }
                 ast_result['children'].append(group_by_expr)
-                clauses['GROUP_BY'] = {
-                    'type': 'group_operation',
-                    'execution_order': 4,
-                    'description': '按指定列分组数据',
-                    'children': [group_by_clause]
-                }
+                if clauses is not None:
+                    clauses['GROUP_BY'] = self.make_plan_step('group_operation', 4, '按指定列分组数据', [group_by_clause])
             
             # 解析HAVING子句
             if self.current_token() and self.current_token()['type'] == 'HAVING':
@@ -276,12 +283,8 @@ class SimpleSQLParser:
                     'children': [having_clause]
                 }
                 ast_result['children'].append(having_expr)
-                clauses['HAVING'] = {
-                    'type': 'group_filter_operation',
-                    'execution_order': 6,
-                    'description': '过滤分组后的结果',
-                    'children': [having_clause]
-                }
+                if clauses is not None:
+                    clauses['HAVING'] = self.make_plan_step('group_filter_operation', 6, '过滤分组后的结果', [having_clause])
             
             # 解析ORDER BY子句
             if (self.current_token() and self.current_token()['type'] == 'ORDER' and
@@ -292,12 +295,8 @@ class SimpleSQLParser:
                     'children': [order_by_clause]
                 }
                 ast_result['children'].append(order_by_expr)
-                clauses['ORDER_BY'] = {
-                    'type': 'sort_operation',
-                    'execution_order': 7,
-                    'description': '对结果进行排序',
-                    'children': [order_by_clause]
-                }
+                if clauses is not None:
+                    clauses['ORDER_BY'] = self.make_plan_step('sort_operation', 7, '对结果进行排序', [order_by_clause])
             
             # 解析LIMIT子句
             if self.current_token() and self.current_token()['type'] == 'LIMIT':
@@ -307,26 +306,32 @@ class SimpleSQLParser:
                     'children': [limit_clause]
                 }
                 ast_result['children'].append(limit_expr)
-                clauses['LIMIT'] = {
-                    'type': 'limit_operation',
-                    'execution_order': 8,
-                    'description': '限制返回的行数',
-                    'children': [limit_clause]
-                }
+                if clauses is not None:
+                    clauses['LIMIT'] = self.make_plan_step('limit_operation', 8, '限制返回的行数', [limit_clause])
         
-        # 按执行顺序排序执行计划
+        if clauses is None:
+            return ast_result
+
+        # 生成执行计划（逻辑执行顺序），按执行顺序排序
         sorted_clauses = sorted(clauses.values(), key=lambda x: x['execution_order'])
-        execution_plan['children'] = sorted_clauses
+        execution_plan = self.make_node('execution_plan', 'SQL查询的逻辑执行计划', sorted_clauses)
         
         # 返回包含AST和执行计划的结构
-        return {
-            'type': 'query_analysis',
-            'description': 'SQL查询分析结果',
-            'children': [
-                ast_result,
-                execution_plan
-            ]
-        }
+        return self.make_node('query_analysis', 'SQL查询分析结果', [ast_result, execution_plan])
+
+    def make_node(self, node_type, description, children):
+        """构建带说明文字的节点，说明文字只在 full 级别附带"""
+        if self.with_descriptions:
+            return {'type': node_type, 'description': description, 'children': children}
+        return {'type': node_type, 'children': children}
+
+    def make_plan_step(self, step_type, execution_order, description, children):
+        """构建执行计划中的一个步骤，说明文字只在 full 级别附带"""
+        if self.with_descriptions:
+            return {'type': step_type, 'execution_order': execution_order, 'description': description,
+                    'children': children}
+        return {'type': step_type, 'execution_order': execution_order, 'children': children}
+    
     
     def parse_select_list(self):
         """解析SELECT列表 - 符合MySQL AST标准"""
@@ -810,101 +815,2348 @@ class SimpleSQLParser:
     def parse_create(self):
         return {'type': 'CREATE', 'children': []}
 
-def main():
-    # 读取输入文件
-    input_file = 'input.sql'
-    if not os.path.exists(input_file):
-        print(f"错误：找不到文件 {input_file}")
+# 结构哈希：每个节点的 hash 由类型、其余属性和子节点哈希自底向上算出（Merkle 树），
+# 两棵子树哈希相同即结构相同，比较和去重时可以整棵跳过
+NODE_HASH_BYTES = 8
+NODE_HASH_EXCLUDED_KEYS = ('children', 'hash')
+# 解析器会产生 None 子节点（例如负数、NULL、子查询等暂不支持的条件右值），按固定占位哈希参与计算
+NODE_HASH_NONE = '0' * (NODE_HASH_BYTES * 2)
+
+def compute_node_hashes(root, shape=False):
+    """迭代后序遍历计算结构哈希，返回根节点哈希（十六进制）
+
+    默认把哈希写入每个节点的 hash 键；已带 hash 的节点（例如共享的子树）直接复用。
+    shape=True 时忽略字面量的取值，只计算查询"形状"的哈希，不写入节点。
+    """
+    import hashlib
+    blake2b = hashlib.blake2b
+    hashes = {id(None): NODE_HASH_NONE}
+    # 迭代后序遍历：执行计划与 AST 共享子句节点，同一个 dict 只访问、计算一次；
+    # None 子节点预先放入 hashes，不会入栈，拼接时取到占位哈希
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        key = id(node)
+        if not expanded:
+            if key in hashes:
+                continue
+            if not shape and 'hash' in node:
+                hashes[key] = node['hash']
+                continue
+            hashes[key] = None
+            stack.append((node, True))
+            children = node.get('children')
+            if children:
+                stack.extend([(child, False) for child in children if id(child) not in hashes])
+            continue
+
+        skip_value = shape and node.get('type') == 'literal'
+        text = ''.join([
+            f'\x1e{k}\x1f{v!r}' for k, v in sorted(node.items())
+            if k not in NODE_HASH_EXCLUDED_KEYS and not (skip_value and k == 'value')
+        ])
+        children = node.get('children')
+        if children:
+            text += '\x1d' + ''.join([hashes[id(child)] for child in children])
+        node_hash = blake2b(text.encode('utf-8'), digest_size=NODE_HASH_BYTES).hexdigest()
+        hashes[key] = node_hash
+        if not shape:
+            node['hash'] = node_hash
+    return hashes[id(root)]
+
+def diff_ast(old, new):
+    """比较两棵带结构哈希的 AST，返回变更列表
+
+    哈希相同的子树直接跳过，工作量只与变化的部分成正比。子节点序列按哈希用 difflib 对齐，
+    每条变更为 {'op': 'insert'|'delete'|'replace'|'update', 'old_path', 'new_path', 'old', 'new'}，
+    路径是从根开始的子节点下标列表；update 表示节点类型不变、自身属性变化（子节点另行比较）。
+    """
+    import difflib
+    for ast in (old, new):
+        if 'hash' not in ast:
+            compute_node_hashes(ast)
+
+    changes = []
+    stack = [(old, new, [], [])]
+    while stack:
+        old_node, new_node, old_path, new_path = stack.pop()
+        if old_node is None or new_node is None:
+            if old_node is not new_node:
+                changes.append({'op': 'replace', 'old_path': old_path, 'new_path': new_path,
+                                'old': old_node, 'new': new_node})
+            continue
+        if old_node['hash'] == new_node['hash']:
+            continue
+        if old_node.get('type') != new_node.get('type'):
+            changes.append({'op': 'replace', 'old_path': old_path, 'new_path': new_path,
+                            'old': old_node, 'new': new_node})
+            continue
+        old_attributes = {k: v for k, v in old_node.items() if k not in NODE_HASH_EXCLUDED_KEYS}
+        new_attributes = {k: v for k, v in new_node.items() if k not in NODE_HASH_EXCLUDED_KEYS}
+        if old_attributes != new_attributes:
+            changes.append({'op': 'update', 'old_path': old_path, 'new_path': new_path,
+                            'old': old_node, 'new': new_node})
+
+        old_children = old_node.get('children') or []
+        new_children = new_node.get('children') or []
+        matcher = difflib.SequenceMatcher(
+            None, [NODE_HASH_NONE if child is None else child['hash'] for child in old_children],
+            [NODE_HASH_NONE if child is None else child['hash'] for child in new_children],
+            autojunk=False
+        )
+        pending = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            # 哈希不同的一段再按节点类型对齐：同类型的成对向下比较，其余记为插入、删除或替换
+            if tag == 'replace':
+                by_type = difflib.SequenceMatcher(
+                    None, [None if child is None else child.get('type') for child in old_children[i1:i2]],
+                    [None if child is None else child.get('type') for child in new_children[j1:j2]], autojunk=False
+                )
+                blocks = [(tag2, i1 + a1, i1 + a2, j1 + b1, j1 + b2)
+                          for tag2, a1, a2, b1, b2 in by_type.get_opcodes()]
+            else:
+                blocks = [(tag, i1, i2, j1, j2)]
+            for tag2, a1, a2, b1, b2 in blocks:
+                paired = min(a2 - a1, b2 - b1) if tag2 in ('equal', 'replace') else 0
+                for k in range(paired):
+                    pending.append((old_children[a1 + k], new_children[b1 + k],
+                                    old_path + [a1 + k], new_path + [b1 + k]))
+                for i in range(a1 + paired, a2):
+                    changes.append({'op': 'delete', 'old_path': old_path + [i], 'new_path': None,
+                                    'old': old_children[i], 'new': None})
+                for j in range(b1 + paired, b2):
+                    changes.append({'op': 'insert', 'old_path': None, 'new_path': new_path + [j],
+                                    'old': None, 'new': new_children[j]})
+        stack.extend(reversed(pending))
+    return changes
+
+# 叶子节点驻留：批量解析时相同的列引用、表引用、关键字等叶子节点共享同一个只读实例
+class FrozenNode(dict):
+    """只读的 AST 节点，任何修改都会抛出 TypeError"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('驻留的 AST 节点是只读的，请先 dict(node) 复制后再修改')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenNode, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+class NodeInterner:
+    """节点驻留表（hash-consing），可由一个 SimpleSQLParser 实例使用，也可在一批解析器之间共享
+
+    开启驻留后解析结果按只读约定使用：内容相同的叶子和子树共享同一个 FrozenNode 实例
+    （子节点为元组，叶子为空元组），修改会直接报错；语句骨架（根节点、select_statement /
+    execution_plan 及其直接子节点）仍是普通 dict，代价估算的标注只写在这些节点上。
+    标识符等字符串经 sys.intern 去重。结构哈希在冻结前算好，之后整棵树的哈希计算直接复用。
+    """
+
+    # 从语句根节点算起，深度达到该值的节点才会被共享
+    SHARED_MIN_DEPTH = 3
+
+    def __init__(self):
+        self.nodes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, node):
+        """返回与 node 内容相同的共享只读节点
+
+        node 的子节点必须都已驻留（None 子节点视为已驻留）；否则（或属性不可哈希时）原样返回。
+        """
+        if isinstance(node, FrozenNode):
+            return node
+        children = node.get('children') or ()
+        if not all(child is None or isinstance(child, FrozenNode) for child in children):
+            return node
+        # 键保留属性的原始顺序，驻留前后序列化结果逐字节一致；
+        # 子节点都是表中常驻的共享实例，可以用 id 表示
+        try:
+            key = (
+                tuple([(k, sys.intern(v) if type(v) is str else v)
+                       for k, v in node.items() if k not in NODE_HASH_EXCLUDED_KEYS]),
+                tuple([id(child) for child in children])
+            )
+            shared = self.nodes.get(key)
+        except TypeError:
+            return node
+        if shared is not None:
+            self.hits += 1
+            return shared
+        self.misses += 1
+        if 'hash' not in node:
+            compute_node_hashes(node)
+        values = dict(key[0])
+        values['children'] = tuple(children)
+        values['hash'] = node['hash']
+        shared = self.nodes[key] = FrozenNode((k, values[k]) for k in node)
+        return shared
+
+    def intern_tree(self, root):
+        """自底向上把树中可共享的节点替换为共享实例（原地修改语句骨架的子节点列表）"""
+        replaced = {}  # id(原节点) -> (原节点, 替换后的节点)；保留原节点引用，避免 id 被复用
+        stack = [(root, 0, False)]
+        while stack:
+            node, depth, expanded = stack.pop()
+            if isinstance(node, FrozenNode):
+                continue
+            if not expanded:
+                if id(node) not in replaced:
+                    replaced[id(node)] = (node, node)
+                    stack.append((node, depth, True))
+                    stack.extend((child, depth + 1, False) for child in node.get('children') or ()
+                                 if child is not None)
+                continue
+            children = node.get('children')
+            if children:
+                children[:] = [replaced[id(child)][1] if child is not None and id(child) in replaced else child
+                               for child in children]
+            if depth >= self.SHARED_MIN_DEPTH:
+                replaced[id(node)] = (node, self.intern(node))
+        return root
+
+# 迭代式 JSON 编码：显式栈代替递归，深度不受解释器递归上限限制，边遍历边分块写出，
+# 与 json.dumps 同参数时输出逐字节一致
+JSON_CHUNK_CHARS = 64 * 1024   # 累积的字符数达到该值时写出一块
+JSON_FOLD_PIECES = 64          # 每累积这么多个片段合并一次并累计字符数
+JSON_FLAT_CONTAINERS = 256     # 紧凑模式下容器数不超过该值的子树整体交给 C 编码器
+
+def iter_json_chunks(obj, indent=None, separators=None, ensure_ascii=True, chunk_chars=JSON_CHUNK_CHARS):
+    """逐块产出 obj 的 JSON 文本，参数含义与 json.dumps 相同
+
+    每块约 chunk_chars 个字符（缩进模式下单个片段带有整层缩进，按字符数而不是片段数分块，
+    内存占用才有上界）。
+    """
+    from json.encoder import encode_basestring, encode_basestring_ascii
+    encode_string = encode_basestring_ascii if ensure_ascii else encode_basestring
+    if indent is not None and not isinstance(indent, str):
+        indent = ' ' * indent
+    if separators is not None:
+        item_separator, key_separator = separators
+    elif indent is not None:
+        item_separator, key_separator = ',', ': '
+    else:
+        item_separator, key_separator = ', ', ': '
+    # 紧凑模式下，小而浅的子树（单个容器数有上限，深度也就有上限）整体交给 C 编码器，
+    # 内存占用仍然有界；带缩进时 json 本身也走纯 Python 实现，不做委托
+    flat_encoder = None
+    if indent is None:
+        flat_encoder = json.JSONEncoder(ensure_ascii=ensure_ascii, separators=(item_separator, key_separator),
+                                        check_circular=False).encode
+    containers = (list, tuple, dict)
+
+    def is_small(value):
+        budget = JSON_FLAT_CONTAINERS
+        pending = [value]
+        while pending:
+            budget -= 1
+            if budget < 0:
+                return False
+            item = pending.pop()
+            for child in (item.values() if isinstance(item, dict) else item):
+                if isinstance(child, containers) and child:
+                    pending.append(child)
+        return True
+
+    def encode_float(value):
+        if value != value:
+            return 'NaN'
+        if value == float('inf'):
+            return 'Infinity'
+        if value == -float('inf'):
+            return '-Infinity'
+        return float.__repr__(value)
+
+    def encode_scalar(value):
+        if isinstance(value, str):
+            return encode_string(value)
+        if value is None:
+            return 'null'
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if isinstance(value, int):
+            return int.__repr__(value)
+        if isinstance(value, float):
+            return encode_float(value)
+        raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+    def encode_key(key):
+        if isinstance(key, str):
+            return encode_string(key)
+        if isinstance(key, (int, float)) or key is None:
+            return encode_string(encode_scalar(key))
+        raise TypeError(f'keys must be str, int, float, bool or None, not {key.__class__.__name__}')
+
+    markers = set()
+    # 每层：[子项迭代器, 是否为对象, 容器 id, 是否尚未输出子项, 子容器跳过探测的层数, 当前退避间隔]
+    # 探测失败（子树太大）后按指数退避跳过若干层再探测，长链上的探测总开销只有对数级
+    stack = []
+    out = []
+    emit = out.append
+    pending = []
+    pending_size = 0
+
+    def take():
+        # 把片段缓冲合并进待写文本，累计字符数达到 chunk_chars 时取出一整块，否则返回 None
+        nonlocal pending_size
+        text = ''.join(out)
+        out.clear()
+        pending.append(text)
+        pending_size += len(text)
+        if pending_size < chunk_chars:
+            return None
+        chunk = ''.join(pending)
+        pending.clear()
+        pending_size = 0
+        return chunk
+
+    value = obj
+    while True:
+        # 输出一个值：标量直接输出，非空容器整体委托或压栈
+        if not isinstance(value, containers):
+            emit(encode_scalar(value))
+        elif not value:
+            emit('{}' if isinstance(value, dict) else '[]')
+        else:
+            parent = stack[-1] if stack else None
+            skip, gap = (parent[4], parent[5]) if parent else (0, 0)
+            encoded = None
+            if flat_encoder is not None and skip == 0 and is_small(value):
+                try:
+                    encoded = flat_encoder(value)
+                except RecursionError:
+                    pass
+            if encoded is not None:
+                emit(encoded)
+            else:
+                if id(value) in markers:
+                    raise ValueError('Circular reference detected')
+                markers.add(id(value))
+                if skip == 0:
+                    gap = gap * 2 if gap else 1
+                    skip = gap
+                else:
+                    skip -= 1
+                is_object = isinstance(value, dict)
+                stack.append([iter(value.items()) if is_object else iter(value), is_object, id(value), True,
+                              skip, gap])
+                emit('{' if is_object else '[')
+        if len(out) >= JSON_FOLD_PIECES:
+            chunk = take()
+            if chunk:
+                yield chunk
+
+        # 继续输出当前容器的子项，连续的标量在这里直接输出；遇到容器时回到外层循环处理，
+        # 当前容器耗尽时输出闭合括号并回到上一层
+        while stack:
+            frame = stack[-1]
+            iterator, is_object = frame[0], frame[1]
+            if indent is None:
+                separator = item_separator
+                prefix = '' if frame[3] else separator
+            else:
+                separator = item_separator + '\n' + indent * len(stack)
+                prefix = ('\n' + indent * len(stack)) if frame[3] else separator
+            found = False
+            for item in iterator:
+                if is_object:
+                    key, item = item
+                    emit(prefix + encode_key(key) + key_separator)
+                elif prefix:
+                    emit(prefix)
+                prefix = separator
+                if isinstance(item, containers):
+                    value = item
+                    found = True
+                    break
+                emit(encode_scalar(item))
+                if len(out) >= JSON_FOLD_PIECES:
+                    chunk = take()
+                    if chunk:
+                        yield chunk
+            if found:
+                frame[3] = False
+                break
+            stack.pop()
+            markers.discard(frame[2])
+            closing = '}' if is_object else ']'
+            emit(closing if indent is None else '\n' + indent * len(stack) + closing)
+            if len(out) >= JSON_FOLD_PIECES:
+                chunk = take()
+                if chunk:
+                    yield chunk
+        else:
+            break
+    pending.extend(out)
+    if pending:
+        yield ''.join(pending)
+
+def write_json(obj, write, indent=None, separators=None, ensure_ascii=True):
+    """把 obj 编码为 JSON，分块调用 write(文本) 写出"""
+    for chunk in iter_json_chunks(obj, indent=indent, separators=separators, ensure_ascii=ensure_ascii):
+        write(chunk)
+
+def iter_statements(lines):
+    """逐行读取SQL文本，按分号切分出完整语句（忽略字符串、反引号和注释中的分号）"""
+    import re
+    scanner = re.compile(r"\\.|--|/\*|\*/|[;'\"`\n]")
+    comments = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+    buf = []
+    state = None  # None / 引号字符 / '--' / '/*'
+
+    def flush():
+        statement = ''.join(buf).strip()
+        buf.clear()
+        # 只包含注释的片段不算语句
+        if comments.sub('', statement).strip():
+            return statement
+        return None
+
+    for line in lines:
+        start = 0
+        for match in scanner.finditer(line):
+            token = match.group(0)
+            if state is None:
+                if token == ';':
+                    buf.append(line[start:match.start()])
+                    start = match.end()
+                    statement = flush()
+                    if statement:
+                        yield statement
+                elif token in ("'", '"', '`', '--', '/*'):
+                    state = token
+            elif state == '--':
+                if token == '\n':
+                    state = None
+            elif state == '/*':
+                if token == '*/':
+                    state = None
+            elif token == state:
+                state = None
+        buf.append(line[start:])
+
+    statement = flush()
+    if statement:
+        yield statement
+
+def parse_cli_options(args, value_options=(), flag_options=()):
+    """解析命令行参数，返回 (选项字典, 位置参数列表)
+
+    value_options 中的选项写作 ``--name value`` 或 ``--name=value``；
+    flag_options 中的选项为开关，也可写作 ``--name=value`` 附带一个可选值。
+    """
+    options = {}
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith('--'):
+            name, eq, value = arg.partition('=')
+            if name in value_options:
+                if not eq:
+                    i += 1
+                    if i >= len(args):
+                        raise ValueError(f"选项 {name} 需要一个参数")
+                    value = args[i]
+                options[name] = value
+            elif name in flag_options:
+                options[name] = value if eq else True
+            else:
+                raise ValueError(f"未知选项 {name}")
+        else:
+            positional.append(arg)
+        i += 1
+    return options, positional
+
+# 持久化解析缓存
+DEFAULT_CACHE_PATH = '.sql_ast_cache.sqlite3'
+DEFAULT_CACHE_MAX_MB = 256
+
+def parser_fingerprint():
+    """解析器版本指纹：解析器源码变化后指纹随之变化，旧缓存条目自动失效"""
+    import hashlib
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+class ParseCache:
+    """基于 SQLite 的持久化 AST 缓存
+
+    以「解析器版本指纹 + 分析级别 + SQL 内容哈希」为键，保存 zlib 压缩后的紧凑 JSON。
+    总大小超过上限时按最近访问时间淘汰；解析器指纹变化时清空旧条目。
+    AST 以扁平节点列表保存（见 flatten），json.loads 的递归深度与树深度无关，再深的 AST 也能缓存。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        import sqlite3
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fingerprint = parser_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        self._touched = []
+        self._stored = False
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS ast_cache ('
+            'key TEXT PRIMARY KEY, data BLOB NOT NULL, '
+            'size INTEGER NOT NULL, atime REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ast_cache_atime ON ast_cache (atime)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS ast_cache_meta (name TEXT PRIMARY KEY, value TEXT)')
+
+        # 解析器代码变化后，旧版本生成的条目全部作废
+        row = self.conn.execute("SELECT value FROM ast_cache_meta WHERE name = 'fingerprint'").fetchone()
+        if not row or row[0] != self.fingerprint:
+            self.conn.execute('DELETE FROM ast_cache')
+            self.conn.execute("INSERT OR REPLACE INTO ast_cache_meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+            self.conn.commit()
+
+    def key(self, sql, level='full'):
+        import hashlib
+        digest = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        return f"{self.fingerprint}:{level}:{digest}"
+
+    def get(self, sql, level='full'):
+        """查找缓存，未命中返回 None"""
+        import zlib
+        key = self.key(sql, level)
+        row = self.conn.execute('SELECT data FROM ast_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append(key)
+        return self.unflatten(json.loads(zlib.decompress(row[0]).decode('utf-8')))
+
+    @staticmethod
+    def flatten(root):
+        """把 AST 展开为节点列表：根节点在下标 0，children 改存子节点的下标（None 子节点仍为 None）
+
+        同一个 dict 只出现一次，执行计划与 AST 共享的子句节点读回后仍是共享的。
+        """
+        order = [root]
+        index = {id(root): 0}
+        for node in order:
+            for child in node.get('children') or ():
+                if child is not None and id(child) not in index:
+                    index[id(child)] = len(order)
+                    order.append(child)
+        flat = []
+        for node in order:
+            if 'children' in node:
+                node = dict(node)
+                node['children'] = [None if child is None else index[id(child)] for child in node['children']]
+            flat.append(node)
+        return flat
+
+    @staticmethod
+    def unflatten(nodes):
+        """flatten 的逆过程，原地把下标换回节点，返回根节点"""
+        for node in nodes:
+            children = node.get('children')
+            if children:
+                node['children'] = [None if i is None else nodes[i] for i in children]
+        return nodes[0]
+
+    def put(self, sql, ast, level='full'):
+        import time
+        import zlib
+        compressor = zlib.compressobj()
+        parts = []
+        write_json(self.flatten(ast), lambda chunk: parts.append(compressor.compress(chunk.encode('utf-8'))),
+                   separators=(',', ':'), ensure_ascii=False)
+        parts.append(compressor.flush())
+        data = b''.join(parts)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO ast_cache (key, data, size, atime) VALUES (?, ?, ?, ?)',
+            (self.key(sql, level), data, len(data), time.time())
+        )
+        self._stored = True
+
+    def parse(self, parser, sql):
+        """优先从缓存读取，未命中时调用解析器并写入缓存"""
+        ast = self.get(sql, parser.level)
+        if ast is None:
+            ast = parser.parse(sql)
+            self.put(sql, ast, parser.level)
+        elif parser.interner is not None and parser.level != 'tokens':
+            # full 级别的缓存条目已带结构哈希，驻留时直接复用；其余级别在驻留后补算
+            parser.interner.intern_tree(ast)
+            compute_node_hashes(ast)
+        return ast
+
+    def evict(self):
+        """总大小超过上限时，按最近访问时间从旧到新淘汰条目"""
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM ast_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in self.conn.execute('SELECT key, size FROM ast_cache ORDER BY atime'):
+            victims.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.conn.executemany('DELETE FROM ast_cache WHERE key = ?', victims)
+
+    def close(self):
+        import time
+        # 批量刷新命中条目的访问时间，避免每次命中都写库
+        if self._touched:
+            now = time.time()
+            self.conn.executemany('UPDATE ast_cache SET atime = ? WHERE key = ?',
+                                  [(now, key) for key in self._touched])
+            self._touched = []
+        if self._stored:
+            self.evict()
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# 基于表统计信息的执行计划代价估算
+DEFAULT_TABLE_ROWS = 1000        # 统计信息缺失时假定的表行数
+DEFAULT_EQ_SELECTIVITY = 0.1     # 列基数未知时等值条件的选择率
+RANGE_SELECTIVITY = 0.3          # 范围条件的选择率
+NULL_SELECTIVITY = 0.1           # IS NULL 条件的选择率
+HAVING_SELECTIVITY = 0.3         # HAVING 条件的选择率
+ROW_EVAL_COST = 0.1              # 在内存中对一行求值的代价（读取一行记为 1）
+
+def load_table_stats(path):
+    """读取表统计信息文件，统一转换为 {'tables': {表名: {'rows', 'indexes', 'columns'}}}
+
+    支持两种 JSON 格式：
+    1. 直接描述：
+       {"tables": {"users": {"rows": 100000,
+                             "indexes": [{"name": "PRIMARY", "columns": ["id"], "unique": true}],
+                             "columns": {"age": {"cardinality": 80}}}}}
+    2. information_schema 导出的行记录：
+       {"TABLES": [{"TABLE_NAME": ..., "TABLE_ROWS": ...}],
+        "STATISTICS": [{"TABLE_NAME": ..., "INDEX_NAME": ..., "SEQ_IN_INDEX": ...,
+                        "COLUMN_NAME": ..., "NON_UNIQUE": ..., "CARDINALITY": ...}]}
+       对应 SELECT * FROM information_schema.TABLES / STATISTICS WHERE TABLE_SCHEMA = '库名'。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    tables = {}
+    if 'tables' in raw:
+        for name, info in raw['tables'].items():
+            tables[name.lower()] = {
+                'rows': int(info.get('rows', DEFAULT_TABLE_ROWS)),
+                'indexes': [
+                    {
+                        'name': index.get('name', ''),
+                        'columns': [column.lower() for column in index.get('columns', [])],
+                        'unique': bool(index.get('unique', False)),
+                    }
+                    for index in info.get('indexes', [])
+                ],
+                'columns': {
+                    column.lower(): {'cardinality': int(column_info.get('cardinality') or 0)}
+                    for column, column_info in info.get('columns', {}).items()
+                },
+            }
+        return {'tables': tables}
+
+    # information_schema 导出的列名大小写不固定，统一转成大写
+    def upper_keys(row):
+        return {key.upper(): value for key, value in row.items()}
+
+    for row in map(upper_keys, raw.get('TABLES', [])):
+        tables[row['TABLE_NAME'].lower()] = {'rows': int(row.get('TABLE_ROWS') or 0), 'indexes': [], 'columns': {}}
+
+    indexes = {}
+    for row in sorted(map(upper_keys, raw.get('STATISTICS', [])),
+                      key=lambda r: (r['TABLE_NAME'], r['INDEX_NAME'], int(r['SEQ_IN_INDEX']))):
+        table = tables.setdefault(row['TABLE_NAME'].lower(),
+                                  {'rows': DEFAULT_TABLE_ROWS, 'indexes': [], 'columns': {}})
+        key = (row['TABLE_NAME'].lower(), row['INDEX_NAME'])
+        if key not in indexes:
+            indexes[key] = {'name': row['INDEX_NAME'], 'columns': [], 'unique': not int(row.get('NON_UNIQUE', 1))}
+            table['indexes'].append(indexes[key])
+        column = row['COLUMN_NAME'].lower()
+        indexes[key]['columns'].append(column)
+        # 索引第一列的 CARDINALITY 就是该列本身的基数
+        if int(row['SEQ_IN_INDEX']) == 1 and row.get('CARDINALITY') is not None:
+            table['columns'].setdefault(column, {'cardinality': int(row['CARDINALITY'])})
+    return {'tables': tables}
+
+def _column_of(node):
+    """从列节点中取出 (表名或别名, 列名)，不是列节点时返回 None"""
+    if not isinstance(node, dict):
+        return None
+    if node.get('type') == 'qualified_column':
+        return node.get('table'), node.get('column')
+    if node.get('type') == 'column':
+        return None, node.get('value')
+    if node.get('type') == 'column_reference':
+        return node.get('table_name'), node.get('column_name')
+    return None
+
+def _conjuncts(condition):
+    """把 AND 连接的条件展开成列表（迭代实现，长条件链不受递归深度限制）"""
+    result = []
+    stack = [condition]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node.get('type') == 'logical_operation' and str(node.get('operator', '')).upper() == 'AND':
+            stack.extend(reversed(node.get('children', [])))
+        else:
+            result.append(node)
+    return result
+
+def _describe_column(column):
+    table, name = column
+    return f"{table}.{name}" if table else name
+
+class CostModel:
+    """根据表统计信息为 execution_plan 的各节点标注估算行数与代价
+
+    代价单位为「读取一行」，只用于比较同一条查询不同执行方式的相对开销。
+    """
+
+    def __init__(self, stats):
+        self.tables = stats.get('tables', {})
+
+    # ---- 统计信息查询 ----
+    def table_rows(self, table):
+        info = self.tables.get((table or '').lower())
+        return max(1, info['rows']) if info else DEFAULT_TABLE_ROWS
+
+    def cardinality(self, table, column):
+        """列基数；统计信息缺失时，唯一索引的首列视为与行数相同，否则返回 None"""
+        info = self.tables.get((table or '').lower())
+        if not info or not column:
+            return None
+        column = column.lower()
+        cardinality = info['columns'].get(column, {}).get('cardinality')
+        if cardinality:
+            return cardinality
+        for index in info['indexes']:
+            if index['unique'] and index['columns'] == [column]:
+                return info['rows']
+        return None
+
+    def leading_index(self, table, columns):
+        """返回以 columns 中某列为首列的索引，优先选择唯一索引"""
+        info = self.tables.get((table or '').lower())
+        if not info:
+            return None
+        columns = {column.lower() for column in columns if column}
+        candidates = [index for index in info['indexes'] if index['columns'] and index['columns'][0] in columns]
+        candidates.sort(key=lambda index: not index['unique'])
+        return candidates[0] if candidates else None
+
+    # ---- 从AST中提取信息 ----
+    def resolve_table(self, qualifier, column, aliases, table_order):
+        """把列引用解析到具体的表名"""
+        if qualifier:
+            return aliases.get(qualifier.lower(), qualifier)
+        # 未限定表名的列：优先匹配统计信息中包含该列的表，否则视为 FROM 中的第一个表
+        for table in table_order:
+            info = self.tables.get(table.lower())
+            if info and (column.lower() in info['columns'] or
+                         any(column.lower() in index['columns'] for index in info['indexes'])):
+                return table
+        return table_order[0] if table_order else None
+
+    def classify_predicate(self, predicate, aliases, table_order):
+        """判断条件是否可以利用索引（sargable），返回描述字典"""
+        node_type = predicate.get('type')
+        if node_type == 'logical_operation':
+            return {'sargable': False, 'reason': f"{predicate.get('operator')} 条件无法直接利用单个索引"}
+
+        if node_type == 'null_check':
+            column = _column_of(predicate['children'][0] if predicate.get('children') else None)
+            if column:
+                table = self.resolve_table(column[0], column[1], aliases, table_order)
+                return {'sargable': True, 'kind': 'null', 'table': table, 'column': column[1]}
+            return {'sargable': False, 'reason': 'IS NULL 判断的不是列'}
+
+        if node_type != 'comparison':
+            return None
+
+        left, right = (predicate.get('children') or [None, None])[:2]
+        left_column, right_column = _column_of(left), _column_of(right)
+        operator = predicate.get('operator')
+
+        for side in (left, right):
+            if isinstance(side, dict) and side.get('type') == 'function_call':
+                return {'sargable': False,
+                        'reason': f"条件中对 {side.get('function_name')}() 的结果比较，无法使用索引"}
+        if left_column and right_column:
+            return {'sargable': False,
+                    'reason': f"列与列比较 {_describe_column(left_column)} {operator} {_describe_column(right_column)}"}
+        column = left_column or right_column
+        if not column:
+            return None
+        if operator in ('!=', '<>'):
+            return {'sargable': False, 'reason': f"{_describe_column(column)} {operator} 不等条件无法使用索引"}
+
+        table = self.resolve_table(column[0], column[1], aliases, table_order)
+        return {'sargable': True, 'kind': 'eq' if operator == '=' else 'range', 'table': table, 'column': column[1]}
+
+    def selectivity(self, predicate):
+        if predicate['kind'] == 'eq':
+            cardinality = self.cardinality(predicate['table'], predicate['column'])
+            return 1.0 / cardinality if cardinality else DEFAULT_EQ_SELECTIVITY
+        if predicate['kind'] == 'null':
+            return NULL_SELECTIVITY
+        return RANGE_SELECTIVITY
+
+    def access_path(self, table, predicates):
+        """选择单表访问方式：有可用索引时走索引，否则全表扫描"""
+        rows = self.table_rows(table)
+        local = [p for p in predicates if p['table'] == table]
+        index = self.leading_index(table, [p['column'] for p in local])
+        if index is None:
+            return {'access_type': 'full_scan', 'index': None, 'rows': rows, 'cost': float(rows), 'used': []}
+
+        used = [p for p in local if p['column'].lower() == index['columns'][0]]
+        selectivity = 1.0
+        for predicate in used:
+            selectivity *= self.selectivity(predicate)
+        matched = max(1.0, rows * selectivity)
+        return {'access_type': 'index', 'index': index['name'], 'rows': matched,
+                'cost': math.log2(rows + 1) + matched, 'used': used}
+
+    def join_step(self, outer_rows, table, join_type, outer_column, inner_column):
+        """估算把 table 连接到当前结果上的行数和代价"""
+        inner_rows = self.table_rows(table)
+        if inner_column is None:
+            # 没有连接条件，等价于笛卡尔积
+            return {'rows': outer_rows * inner_rows, 'cost': outer_rows * inner_rows,
+                    'access_type': 'full_scan', 'index': None}
+
+        inner_card = self.cardinality(table, inner_column[1]) or inner_rows
+        outer_card = self.cardinality(outer_column[0], outer_column[1]) if outer_column else None
+        rows = outer_rows * inner_rows / max(inner_card, outer_card or 1, 1)
+        if join_type == 'LEFT':
+            rows = max(rows, outer_rows)
+
+        # 整表扫描内表（哈希连接：建表 + 探测）；连接列有索引时再估算索引嵌套循环，取代价低的一种
+        scan_cost = inner_rows + outer_rows
+        index = self.leading_index(table, [inner_column[1]])
+        if index:
+            fanout = inner_rows / inner_card
+            cost = outer_rows * (math.log2(inner_rows + 1) + fanout)
+            if cost <= scan_cost:
+                return {'rows': rows, 'cost': cost, 'access_type': 'index', 'index': index['name']}
+        return {'rows': rows, 'cost': scan_cost, 'access_type': 'full_scan', 'index': None}
+
+    # ---- 标注执行计划 ----
+    def describe_query(self, analysis):
+        """从 query_analysis 中提取代价估算和索引建议需要的信息，不是 SELECT 分析结果时返回 None
+
+        返回的字典包含：执行计划各步骤、FROM 表、连接列表、别名映射，以及按能否利用索引分好类的 WHERE 条件。
+        """
+        if not isinstance(analysis, dict) or analysis.get('type') != 'query_analysis':
+            return None
+        plan = next((child for child in analysis['children'] if child.get('type') == 'execution_plan'), None)
+        if plan is None:
+            return None
+        steps = {step['type']: step for step in plan['children']}
+
+        # FROM 表和连接表，以及别名映射
+        aliases = {}
+        table_order = []
+        base_table = None
+        scan = steps.get('table_scan')
+        if scan:
+            from_clause = scan['children'][0]
+            if from_clause.get('children'):
+                base_table = from_clause['children'][0]
+        joins = []
+        for join in (steps['join_operation']['children'] if 'join_operation' in steps else []):
+            if not join:
+                continue
+            info = {'join_type': 'INNER', 'table': None, 'condition': None}
+            for child in join.get('children', []):
+                if child.get('type') == 'join_type':
+                    info['join_type'] = child['value'].upper()
+                elif child.get('type') == 'table_reference':
+                    info['table'] = child
+                elif child.get('type') == 'ON':
+                    info['condition'] = next((c for c in child['children'] if c.get('type') == 'join_condition'), None)
+            if info['table']:
+                joins.append(info)
+        for reference in [base_table] + [join['table'] for join in joins]:
+            if reference:
+                table_order.append(reference['table_name'])
+                aliases[reference['table_name'].lower()] = reference['table_name']
+                if reference.get('alias'):
+                    aliases[reference['alias'].lower()] = reference['table_name']
+
+        # WHERE 条件分类
+        predicates = []
+        non_sargable = []
+        if 'filter_operation' in steps:
+            where_clause = steps['filter_operation']['children'][0]
+            for conjunct in _conjuncts(where_clause['children'][0] if where_clause.get('children') else None):
+                result = self.classify_predicate(conjunct, aliases, table_order)
+                if result is None:
+                    continue
+                if result['sargable']:
+                    predicates.append(result)
+                else:
+                    non_sargable.append(result['reason'])
+
+        return {'plan': plan, 'steps': steps, 'base_table': base_table, 'joins': joins, 'aliases': aliases,
+                'table_order': table_order, 'predicates': predicates, 'non_sargable': non_sargable}
+
+    def annotate(self, analysis):
+        """为 query_analysis 中的执行计划标注代价，原地修改并返回 analysis"""
+        query = self.describe_query(analysis)
+        if query is None:
+            return analysis
+        plan, steps, base_table, joins = query['plan'], query['steps'], query['base_table'], query['joins']
+        aliases, table_order, predicates = query['aliases'], query['table_order'], query['predicates']
+        warnings_by_filter = [f"非 sargable 条件：{reason}" for reason in query['non_sargable']]
+        scan = steps.get('table_scan')
+
+        total_cost = 0.0
+        rows = 0.0
+        used = []
+
+        # FROM：基础表访问
+        if scan and base_table:
+            path = self.access_path(base_table['table_name'], predicates)
+            used.extend(path['used'])
+            rows = path['rows']
+            self._mark(scan, rows, path['cost'], access_type=path['access_type'], index=path['index'])
+            if path['access_type'] == 'full_scan':
+                scan.setdefault('warnings', []).append(f"全表扫描 {base_table['table_name']}（约 {self.table_rows(base_table['table_name'])} 行）")
+            total_cost += path['cost']
+
+        # JOIN：按书写顺序逐个连接
+        if joins:
+            details = []
+            join_cost = 0.0
+            for join in joins:
+                table = join['table']['table_name']
+                outer_column, inner_column = self.join_columns(join['condition'], table, aliases)
+                step = self.join_step(rows, table, join['join_type'], outer_column, inner_column)
+                rows = step['rows']
+                join_cost += step['cost']
+                detail = {'table': table, 'join_type': join['join_type'], 'access_type': step['access_type'],
+                          'index': step['index'], 'estimated_rows': max(1, int(round(rows))),
+                          'estimated_cost': round(step['cost'], 2)}
+                details.append(detail)
+                # 连接列有索引但外表行数多、哈希连接更便宜时不算问题，不提示
+                if step['access_type'] == 'full_scan' and (
+                        inner_column is None or not self.leading_index(table, [inner_column[1]])):
+                    reason = '没有连接条件' if inner_column is None else f"连接列 {inner_column[1]} 上没有索引"
+                    steps['join_operation'].setdefault('warnings', []).append(f"全表扫描 {table}（{reason}）")
+            self._mark(steps['join_operation'], rows, join_cost, joins=details)
+            total_cost += join_cost
+
+            suggestion = self.suggest_join_order(base_table, joins, predicates, aliases, join_cost)
+            if suggestion:
+                steps['join_operation']['suggested_join_order'] = suggestion['order']
+                steps['join_operation']['suggested_join_cost'] = round(suggestion['cost'], 2)
+
+        # WHERE：索引已经用掉的条件不再重复计算选择率
+        if 'filter_operation' in steps:
+            cost = rows * ROW_EVAL_COST
+            for predicate in predicates:
+                if predicate not in used:
+                    rows *= self.selectivity(predicate)
+            self._mark(steps['filter_operation'], rows, cost)
+            if warnings_by_filter:
+                steps['filter_operation']['warnings'] = warnings_by_filter
+            total_cost += cost
+
+        # GROUP BY：分组数不超过分组列基数的乘积
+        if 'group_operation' in steps:
+            cost = rows * math.log2(rows + 1) * ROW_EVAL_COST
+            groups = 1.0
+            known = True
+            for column in self.clause_columns(steps['group_operation']):
+                table = self.resolve_table(column[0], column[1], aliases, table_order)
+                cardinality = self.cardinality(table, column[1])
+                if cardinality is None:
+                    known = False
+                    break
+                groups *= cardinality
+            rows = min(rows, groups) if known else rows
+            self._mark(steps['group_operation'], rows, cost)
+            total_cost += cost
+
+        if 'group_filter_operation' in steps:
+            cost = rows * ROW_EVAL_COST
+            rows *= HAVING_SELECTIVITY
+            self._mark(steps['group_filter_operation'], rows, cost)
+            total_cost += cost
+
+        if 'select_operation' in steps:
+            self._mark(steps['select_operation'], rows, 0.0)
+
+        if 'sort_operation' in steps:
+            cost = rows * math.log2(rows + 1) * ROW_EVAL_COST
+            self._mark(steps['sort_operation'], rows, cost)
+            total_cost += cost
+
+        if 'limit_operation' in steps:
+            limit_clause = steps['limit_operation']['children'][0]
+            literal = next((c for c in limit_clause['children'] if c.get('type') == 'literal'), None)
+            if literal:
+                rows = min(rows, int(literal['value']))
+            self._mark(steps['limit_operation'], rows, 0.0)
+
+        self._mark(plan, rows, total_cost)
+        return analysis
+
+    def suggest_join_order(self, base_table, joins, predicates, aliases, current_cost):
+        """多表内连接时，按贪心策略给出更便宜的连接顺序；没有更优方案时返回 None"""
+        if len(joins) < 2 or not base_table or any(join['join_type'] not in ('INNER', 'JOIN') for join in joins):
+            return None
+
+        tables = [base_table['table_name']] + [join['table']['table_name'] for join in joins]
+        edges = []
+        for join in joins:
+            condition = join['condition']
+            if condition:
+                left, right = (_column_of(child) for child in condition['children'][:2])
+                if left and right and left[0] and right[0]:
+                    edges.append(((aliases.get(left[0].lower(), left[0]), left[1]),
+                                  (aliases.get(right[0].lower(), right[0]), right[1])))
+
+        # 各表经过本地条件过滤后的行数
+        def filtered_rows(table):
+            rows = float(self.table_rows(table))
+            for predicate in predicates:
+                if predicate['table'] == table:
+                    rows *= self.selectivity(predicate)
+            return max(1.0, rows)
+
+        def edge_to(joined, table):
+            for a, b in edges:
+                if a[0] == table and b[0] in joined:
+                    return b, a
+                if b[0] == table and a[0] in joined:
+                    return a, b
+            return None, None
+
+        first = min(tables, key=filtered_rows)
+        order = [first]
+        path = self.access_path(first, predicates)
+        rows, cost = path['rows'], path['cost']
+        remaining = [table for table in tables if table != first]
+        while remaining:
+            best = None
+            for table in remaining:
+                outer_column, inner_column = edge_to(set(order), table)
+                step = self.join_step(rows, table, 'INNER', outer_column, inner_column)
+                if best is None or step['cost'] < best[1]['cost']:
+                    best = (table, step)
+            table, step = best
+            order.append(table)
+            remaining.remove(table)
+            rows = step['rows']
+            cost += step['cost']
+
+        # 与书写顺序比较（书写顺序同样包含基础表的访问代价）
+        written_cost = current_cost + self.access_path(tables[0], predicates)['cost']
+        if order == tables or cost >= written_cost:
+            return None
+        return {'order': order, 'cost': cost}
+
+    def join_columns(self, condition, table, aliases):
+        """把连接条件拆成 (外表列, 内表列)，列以 (表名, 列名) 表示"""
+        if not condition:
+            return None, None
+        columns = [_column_of(child) for child in condition.get('children', [])[:2]]
+        if len(columns) < 2 or not all(columns):
+            return None, None
+        resolved = [(aliases.get((c[0] or '').lower(), c[0]), c[1]) for c in columns]
+        if resolved[0][0] == table:
+            return resolved[1], resolved[0]
+        return resolved[0], resolved[1]
+
+    def clause_columns(self, step):
+        """取出 GROUP BY / ORDER BY 子句中的列"""
+        columns = []
+        for child in step['children'][0].get('children', []):
+            if child.get('type') == 'group_list':
+                columns.extend(filter(None, (_column_of(column) for column in child['children'])))
+            elif child.get('type') == 'order_list':
+                columns.extend(filter(None, (_column_of(item['children'][0]) for item in child['children'])))
+        return columns
+
+    @staticmethod
+    def _mark(node, rows, cost, **extra):
+        # 估算值不足一行时按一行显示，避免出现「0 行」的误导
+        node['estimated_rows'] = max(1, int(round(rows))) if rows > 0 else 0
+        node['estimated_cost'] = round(cost, 2)
+        for key, value in extra.items():
+            if value is not None:
+                node[key] = value
+
+def make_script_node(results, hashed=True):
+    """单条语句保持原有输出结构，多条语句汇总到 script 节点下；hashed=False 时不计算结构哈希"""
+    if not results:
+        node = {'type': 'root', 'children': []}
+    elif len(results) == 1:
+        return results[0]
+    else:
+        node = {'type': 'script', 'statement_count': len(results), 'children': results}
+    if hashed:
+        compute_node_hashes(node)
+    return node
+
+# 单条语句的语法树不超过该大小（紧凑 JSON 的字符数）时，才以缩进格式回显到终端
+AST_ECHO_MAX_CHARS = 64 * 1024
+
+def main(argv=None):
+    try:
+        options, input_files = parse_cli_options(
+            sys.argv[1:] if argv is None else argv,
+            value_options=('--cache-size', '--stats', '--level'),
+            flag_options=('--cache', '--intern')
+        )
+        max_mb = int(options.get('--cache-size', DEFAULT_CACHE_MAX_MB))
+        level = SimpleSQLParser.check_level(options.get('--level', 'full'))
+    except ValueError as e:
+        print(f"错误：{e}")
         sys.exit(1)
-    
+
+    # 读取输入文件
+    input_files = input_files or ['input.sql']
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            print(f"错误：找不到文件 {input_file}")
+            sys.exit(1)
+
+    cache = None
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            sql_content = f.read().strip()
-        
-        if not sql_content:
+        if '--cache' in options:
+            cache_path = options['--cache'] if isinstance(options['--cache'], str) else DEFAULT_CACHE_PATH
+            cache = ParseCache(cache_path, max_bytes=max_mb * 1024 * 1024)
+
+        # 提供了表统计信息时，为执行计划标注估算代价（需要 ast+plan 或 full 级别）
+        cost_model = CostModel(load_table_stats(options['--stats'])) if '--stats' in options else None
+
+        # 解析SQL（--intern：大批量解析时共享相同的子树，降低内存占用；--level：只做需要的分析阶段）
+        parser = SimpleSQLParser(interner=NodeInterner() if options.get('--intern') else None, level=level)
+        results = []
+        for input_file in input_files:
+            print(f"正在解析SQL文件: {input_file}")
+            with open(input_file, 'r', encoding='utf-8') as f:
+                for statement in iter_statements(f):
+                    if cache:
+                        ast = cache.parse(parser, statement)
+                    else:
+                        ast = parser.parse(statement)
+                    if cost_model:
+                        cost_model.annotate(ast)
+                    results.append(ast)
+
+        if not results:
             print("错误：SQL文件为空")
             sys.exit(1)
-        
-        print(f"正在解析SQL: {sql_content}")
-        
-        # 解析SQL
-        parser = SimpleSQLParser()
-        ast = parser.parse(sql_content)
-        
-        # 输出到JSON文件
+
+        ast = make_script_node(results, hashed=parser.with_hashes)
+
+        # 输出到JSON文件：紧凑格式，缩进输出的体积随树深度平方增长
         output_file = 'ast.json'
+        written = 0
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(ast, f, ensure_ascii=False, indent=2)
-        
+            for chunk in iter_json_chunks(ast, separators=(',', ':'), ensure_ascii=False):
+                f.write(chunk)
+                written += len(chunk)
+
         print(f"AST已生成并保存到 {output_file}")
-        print("\n生成的AST结构:")
-        print(json.dumps(ast, ensure_ascii=False, indent=2))
-        
+        if cache:
+            print(f"缓存命中 {cache.hits} 条，未命中 {cache.misses} 条（{cache.path}）")
+        if len(results) == 1 and written <= AST_ECHO_MAX_CHARS:
+            print("\n生成的AST结构:")
+            write_json(ast, sys.stdout.write, indent=2, ensure_ascii=False)
+            print()
+        elif len(results) == 1:
+            print(f"语法树较大（{written} 个字符），不在终端显示，请查看 {output_file}")
+        else:
+            print(f"共解析 {len(results)} 条SQL语句")
+
     except Exception as e:
         print(f"错误：{e}")
         sys.exit(1)
+    finally:
+        if cache:
+            cache.close()
 
-# 添加HTTP服务器支持
-import http.server
-import socketserver
-import json
-from urllib.parse import urlparse, parse_qs
+# 添加HTTP服务器支持（http.server 只在服务器模式下才导入，文件解析模式不为此付出启动开销）
+# 实时解析通道：可视化页面通过 /parse-ws 上的 WebSocket 长连接逐次发送编辑后的 SQL，
+# 省去每次按键都要建立连接、发送 CORS 预检的开销
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_MAX_MESSAGE = 16 * 1024 * 1024
+
+def websocket_accept_key(key):
+    """根据客户端的 Sec-WebSocket-Key 计算握手应答"""
+    import base64
+    import hashlib
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+
+class WebSocketCloseError(ValueError):
+    """客户端违反协议或消息过大，需要以 code 状态码关闭连接（1002 协议错误，1009 消息过大）"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+def read_websocket_frame(rfile):
+    """读取一个 WebSocket 帧，返回 (fin, opcode, payload)；连接已关闭时返回 None
+
+    客户端发来的帧必须带掩码（RFC 6455 5.1），否则抛出 WebSocketCloseError。
+    """
+    import struct
+    header = rfile.read(2)
+    if len(header) < 2:
+        return None
+    fin = bool(header[0] & 0x80)
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', rfile.read(8))[0]
+    if length > WEBSOCKET_MAX_MESSAGE:
+        raise WebSocketCloseError(1009, f'WebSocket 帧过大: {length} 字节')
+    if not header[1] & 0x80:
+        raise WebSocketCloseError(1002, '客户端帧必须带掩码')
+    mask = rfile.read(4)
+    payload = rfile.read(length)
+    if len(payload) < length:
+        return None
+    if length:
+        # 按整数一次性异或掩码，避免逐字节循环
+        repeated = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+    return fin, opcode, payload
+
+def encode_websocket_frame(payload, opcode=0x1):
+    """编码一个服务端发出的（不带掩码的）完整 WebSocket 帧"""
+    import struct
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+class LiveParseSession:
+    """一条 WebSocket 连接上的实时解析会话
 
-class SQLParserHTTPHandler(http.server.SimpleHTTPRequestHandler):
-    def do_POST(self):
-        if self.path == '/parse-sql':
+    请求格式为 {"id": 编号, "sql": "...", "level": 分析级别（可选，默认 full）}，每个请求都会收到一条带相同 id 的应答，
+    status 为 ok（附 ast）、error（附 message）或 cancelled。读线程只登记最新的请求，
+    解析线程每次取最新的一条：排队期间被新请求取代的直接回复 cancelled；正在解析时
+    被取代的，解析完成后跳过代价估算和序列化，同样回复 cancelled。
+    """
+
+    def __init__(self, send, cost_model=None):
+        import threading
+        self.send = send
+        self.cost_model = cost_model
+        self.parsers = {}  # 分析级别 -> 解析器
+        self.condition = threading.Condition()
+        self.pending = None
+        self.latest = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, message):
+        """登记一条客户端消息（原始字节），合并掉尚未开始解析的旧请求"""
+        try:
+            request = json.loads(message.decode('utf-8'))
+            if not isinstance(request, dict) or not isinstance(request.get('sql'), str):
+                raise ValueError('请求需要包含 sql 字段')
+        except ValueError as e:
+            self.send({'id': None, 'status': 'error', 'message': str(e)})
+            return
+        with self.condition:
+            if self.pending is not None:
+                self.send({'id': self.pending.get('id'), 'status': 'cancelled'})
+            self.pending = request
+            self.latest = request
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def _superseded(self, request):
+        with self.condition:
+            return self.latest is not request or self.closed
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                request, self.pending = self.pending, None
             try:
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-                
-                sql = data.get('sql', '')
-                if not sql:
-                    self.send_error(400, 'No SQL provided')
+                try:
+                    self.send(self._analyze(request))
+                except OSError:
+                    raise
+                except Exception as e:
+                    # 序列化等环节出错时回复错误，解析线程继续处理后续请求
+                    self.send({'id': request.get('id'), 'status': 'error', 'message': str(e)})
+            except OSError:
+                # 客户端已断开
+                self.close()
+                return
+
+    def _analyze(self, request):
+        try:
+            level = request.get('level', 'full')
+            parser = self.parsers.get(level)
+            if parser is None:
+                parser = self.parsers[level] = SimpleSQLParser(level=level)
+            ast = parser.parse(request['sql'])
+            if self._superseded(request):
+                return {'id': request.get('id'), 'status': 'cancelled'}
+            if self.cost_model:
+                self.cost_model.annotate(ast)
+            return {'id': request.get('id'), 'status': 'ok', 'ast': ast}
+        except Exception as e:
+            return {'id': request.get('id'), 'status': 'error', 'message': str(e)}
+
+def make_http_handler(cost_model=None):
+    """构建 /parse-sql 接口的HTTP请求处理类"""
+    import http.server
+    import threading
+
+    class SQLParserHTTPHandler(http.server.SimpleHTTPRequestHandler):
+        # 保持连接复用，浏览器连续请求时不必每次重新建立 TCP 连接；
+        # 响应头和正文分两次写出，关闭 Nagle 算法避免与延迟 ACK 叠加出约 40ms 的等待
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path == '/parse-ws':
+                self.handle_websocket()
+            else:
+                super().do_GET()
+
+        def do_POST(self):
+            if self.path == '/parse-sql':
+                try:
+                    content_length = int(self.headers['Content-Length'])
+                    post_data = self.rfile.read(content_length)
+                    data = json.loads(post_data.decode('utf-8'))
+                    
+                    sql = data.get('sql', '')
+                    if not sql:
+                        self.send_error(400, 'No SQL provided')
+                        return
+                    level = data.get('level', 'full')
+                    try:
+                        SimpleSQLParser.check_level(level)
+                    except ValueError:
+                        self.send_error(400, f'Unknown analysis level: {level}')
+                        return
+                    
+                    # 使用现有的解析器解析SQL
+                    parser = SimpleSQLParser(level=level)
+                    ast = parser.parse(sql)
+                    if cost_model:
+                        cost_model.annotate(ast)
+                    
+                except Exception as e:
+                    self.send_error(500, f'Parse error: {str(e)}')
                     return
-                
-                # 使用现有的解析器解析SQL
-                parser = SimpleSQLParser()
-                ast = parser.parse(sql)
-                
-                # 返回JSON响应
+
+                # 返回JSON响应：紧凑格式、分块传输编码，边编码边写出，不在内存里拼出完整响应
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
                 self.send_header('Access-Control-Allow-Origin', '*')
                 self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
                 self.send_header('Access-Control-Allow-Headers', 'Content-Type')
                 self.end_headers()
-                
-                response = json.dumps(ast, ensure_ascii=False, indent=2)
-                self.wfile.write(response.encode('utf-8'))
-                
-            except Exception as e:
-                self.send_error(500, f'Parse error: {str(e)}')
-        else:
-            super().do_POST()
-    
-    def do_OPTIONS(self):
-        # 处理CORS预检请求
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
 
-def start_server(port=8001):
+                def write_chunk(text):
+                    data = text.encode('utf-8')
+                    self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+
+                try:
+                    write_json(ast, write_chunk, separators=(',', ':'), ensure_ascii=False)
+                    self.wfile.write(b'0\r\n\r\n')
+                except Exception:
+                    # 响应头已经发出，无法再改成错误响应，只能断开连接让客户端感知
+                    self.close_connection = True
+            else:
+                super().do_POST()
+        
+        def do_OPTIONS(self):
+            # 处理CORS预检请求
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def handle_websocket(self):
+            """完成 WebSocket 握手，随后在本线程收帧，解析交给 LiveParseSession 的线程"""
+            key = self.headers.get('Sec-WebSocket-Key')
+            if self.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+                self.send_error(400, 'Expected WebSocket upgrade')
+                return
+            self.send_response(101, 'Switching Protocols')
+            self.send_header('Upgrade', 'websocket')
+            self.send_header('Connection', 'Upgrade')
+            self.send_header('Sec-WebSocket-Accept', websocket_accept_key(key))
+            self.end_headers()
+            self.close_connection = True
+
+            write_lock = threading.Lock()
+
+            def send_frame(payload, opcode=0x1):
+                with write_lock:
+                    self.wfile.write(encode_websocket_frame(payload, opcode))
+
+            def send_message(message):
+                text = ''.join(iter_json_chunks(message, separators=(',', ':'), ensure_ascii=False))
+                send_frame(text.encode('utf-8'))
+
+            session = LiveParseSession(send_message, cost_model)
+            fragments = []
+            fragments_size = 0
+            try:
+                while True:
+                    frame = read_websocket_frame(self.rfile)
+                    if frame is None:
+                        break
+                    fin, opcode, payload = frame
+                    if opcode == 0x8:  # 关闭
+                        send_frame(payload[:2], 0x8)
+                        break
+                    if opcode == 0x9:  # ping
+                        send_frame(payload, 0xA)
+                        continue
+                    if opcode == 0xA:  # pong
+                        continue
+                    # 分片消息按累计大小限制，避免用大量小分片绕过单帧上限
+                    fragments_size += len(payload)
+                    if fragments_size > WEBSOCKET_MAX_MESSAGE:
+                        raise WebSocketCloseError(1009, f'WebSocket 消息过大: 超过 {WEBSOCKET_MAX_MESSAGE} 字节')
+                    fragments.append(payload)
+                    if fin:
+                        session.submit(b''.join(fragments))
+                        fragments = []
+                        fragments_size = 0
+            except WebSocketCloseError as e:
+                try:
+                    send_frame(e.code.to_bytes(2, 'big') + str(e).encode('utf-8'), 0x8)
+                except OSError:
+                    pass
+            except (OSError, ValueError):
+                pass
+            finally:
+                session.close()
+
+    return SQLParserHTTPHandler
+
+def start_server(port=8001, stats_file=None):
     """启动HTTP服务器"""
-    with socketserver.TCPServer(("", port), SQLParserHTTPHandler) as httpd:
+    import socketserver
+    cost_model = CostModel(load_table_stats(stats_file)) if stats_file else None
+
+    # 每个连接一个线程：WebSocket 长连接不会阻塞静态文件和 /parse-sql 请求
+    class ParseHTTPServer(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with ParseHTTPServer(("", port), make_http_handler(cost_model)) as httpd:
         print(f"SQL解析服务器启动在端口 {port}")
+        if stats_file:
+            print(f"已加载表统计信息 {stats_file}，执行计划将标注估算代价")
         print(f"访问 http://localhost:{port} 查看可视化")
         httpd.serve_forever()
 
+def run_server(argv):
+    """server 子命令：校验参数后启动HTTP服务器"""
+    try:
+        options, args = parse_cli_options(argv, value_options=('--stats',))
+        if len(args) > 1:
+            raise ValueError("用法：python parse.py server [端口] [--stats 统计信息文件]")
+        if args and not args[0].isdigit():
+            raise ValueError(f"端口必须是整数：{args[0]}")
+        port = int(args[0]) if args else 8001
+        stats_file = options.get('--stats')
+        if stats_file and not os.path.exists(stats_file):
+            raise ValueError(f"找不到文件 {stats_file}")
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+    start_server(port, stats_file)
+
+# 常驻解析守护进程：通过 Unix 域套接字接收 SQL，返回紧凑 JSON（客户端见 parse_client.py）
+DEFAULT_DAEMON_SOCKET = os.environ.get('SQL_AST_SOCKET', '/tmp/sql-ast-visualizer.sock')
+
+def parse_sql_text(parser, sql):
+    """解析一段可能包含多条语句的SQL文本"""
+    return make_script_node([parser.parse(statement) for statement in iter_statements(sql.splitlines(True))],
+                            hashed=parser.with_hashes)
+
+def start_daemon(socket_path=DEFAULT_DAEMON_SOCKET, level='full'):
+    """启动常驻解析进程
+
+    协议：客户端连接后写入 SQL 文本并关闭写端，守护进程返回一行紧凑 JSON 后关闭连接。
+    解析器和词法正则在进程内复用，每次请求只付出解析本身的开销；level 为返回结果的分析级别。
+    """
+    import signal
+    import socket
+    import socketserver
+
+    # 清理上次异常退出遗留的套接字文件，但不抢占正在运行的守护进程
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            print(f"错误：守护进程已在 {socket_path} 运行")
+            sys.exit(1)
+        except OSError:
+            os.unlink(socket_path)
+        finally:
+            probe.close()
+
+    parser = SimpleSQLParser(level=level)
+
+    class ParseRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                # 解码放在 try 内：非 UTF-8 输入同样返回 JSON 错误，而不是直接断开
+                ast = parse_sql_text(parser, self.rfile.read().decode('utf-8'))
+            except Exception as e:
+                ast = {'type': 'error', 'message': str(e), 'children': []}
+            try:
+                write_json(ast, lambda chunk: self.wfile.write(chunk.encode('utf-8')),
+                           separators=(',', ':'), ensure_ascii=False)
+                self.wfile.write(b'\n')
+            except BrokenPipeError:
+                pass  # 客户端提前断开（例如启动时的存活探测）
+
+    # 收到 SIGTERM 时同样走正常退出流程，删除套接字文件
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with socketserver.UnixStreamServer(socket_path, ParseRequestHandler) as server:
+        print(f"SQL解析守护进程监听 {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+def run_daemon(argv):
+    """daemon 子命令：校验参数后启动常驻解析进程"""
+    try:
+        options, args = parse_cli_options(argv, value_options=('--level',))
+        if len(args) > 1:
+            raise ValueError("用法：python parse.py daemon [套接字路径] [--level tokens|ast|ast+plan|full]")
+        level = SimpleSQLParser.check_level(options.get('--level', 'full'))
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+    start_daemon(args[0] if args else DEFAULT_DAEMON_SOCKET, level)
+
+# MySQL 慢查询日志 / 通用查询日志的流式读取
+LOG_IDLE = None  # follow_lines 追上文件末尾时产出的空闲标记，提示读取器提交手头的条目
+DEFAULT_MAX_STATEMENT_CHARS = 1024 * 1024
+
+def follow_lines(path, poll_interval=0.5, follow=True):
+    """逐行读取日志文件；follow 模式下类似 tail -F，持续等待新内容
+
+    文件被轮转（inode 变化）或截断（长度变小）时重新从头读取。读到末尾时产出 LOG_IDLE。
+    """
+    import time
+
+    f = None
+    pending = ''
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'r', encoding='utf-8', errors='replace')
+                except FileNotFoundError:
+                    if not follow:
+                        raise
+                    # 轮转过程中文件可能暂时不存在
+                    time.sleep(poll_interval)
+                    continue
+
+            line = f.readline()
+            if line:
+                if line.endswith('\n'):
+                    yield pending + line
+                    pending = ''
+                else:
+                    # 写入方还没写完这一行，先缓存起来
+                    pending += line
+                continue
+
+            if not follow:
+                if pending:
+                    yield pending
+                return
+
+            yield LOG_IDLE
+            time.sleep(poll_interval)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+                f.close()
+                f = None
+                pending = ''
+    finally:
+        if f is not None:
+            f.close()
+
+def _is_mysqld_banner(line):
+    """mysqld 启动时写入日志的头部信息"""
+    return (', Version: ' in line and 'started with:' in line) or \
+        line.startswith('Tcp port:') or \
+        line.startswith('Time                 Id Command')
+
+def iter_slow_log(lines, max_statement_chars=DEFAULT_MAX_STATEMENT_CHARS):
+    """解析慢查询日志，每条语句产出一个带元数据的字典"""
+    import re
+    metric = re.compile(r'(\w+):\s+(\S+)')
+    set_timestamp = re.compile(r'SET\s+timestamp\s*=\s*(\d+)\s*;', re.IGNORECASE)
+    use_db = re.compile(r'use\s+`?(\w+)`?\s*;\s*$', re.IGNORECASE)
+
+    meta = {}
+    buf = []
+    size = 0
+    truncated = False
+    db = None
+
+    def flush():
+        nonlocal meta, size, truncated
+        record = None
+        sql = ''.join(buf).strip()
+        if sql:
+            record = dict(meta, sql=sql)
+            if db:
+                record.setdefault('db', db)
+            if truncated:
+                record['truncated'] = True
+        buf.clear()
+        meta = {}
+        size = 0
+        truncated = False
+        return record
+
+    for line in lines:
+        if line is LOG_IDLE:
+            # 语句以分号结尾时已经提交，空闲时不提交半条语句
+            continue
+
+        if line.startswith('#') or _is_mysqld_banner(line):
+            # 下一个条目的头部开始，提交上一条语句
+            if buf:
+                record = flush()
+                if record:
+                    yield record
+            if line.startswith('# Time:'):
+                meta['time'] = line[len('# Time:'):].strip()
+            elif line.startswith('# User@Host:'):
+                meta['user_host'] = line[len('# User@Host:'):].split('Id:')[0].strip()
+            elif line.startswith('#'):
+                for name, value in metric.findall(line):
+                    key = name.lower()
+                    if key in ('query_time', 'lock_time'):
+                        meta[key] = float(value)
+                    elif key in ('rows_sent', 'rows_examined'):
+                        meta[key] = int(value)
+            continue
+
+        if not buf:
+            match = set_timestamp.match(line.strip())
+            if match:
+                meta['timestamp'] = int(match.group(1))
+                continue
+            match = use_db.match(line.strip())
+            if match:
+                db = match.group(1)
+                continue
+
+        # 超长语句只保留前 max_statement_chars 个字符，保证内存有界
+        if size < max_statement_chars:
+            buf.append(line[:max_statement_chars - size])
+            size += len(line)
+        if size > max_statement_chars:
+            truncated = True
+
+        # 慢查询日志中每条语句都以分号结尾，读到即可提交，不必等下一个条目
+        if line.rstrip().endswith(';'):
+            record = flush()
+            if record:
+                yield record
+
+    record = flush()
+    if record:
+        yield record
+
+def iter_general_log(lines, max_statement_chars=DEFAULT_MAX_STATEMENT_CHARS):
+    """解析通用查询日志，只产出 Query / Execute 命令对应的语句"""
+    import re
+    # 5.7+：2024-01-01T10:00:00.123456Z\t   12 Query\tSELECT ...
+    # 5.6 ：240101 10:00:00\t   12 Query\tSELECT ...（同一秒内的后续行时间列为空）
+    entry = re.compile(
+        r'^(\d{4}-\d\d-\d\dT\S+|\d{6}\s+\d{1,2}:\d\d:\d\d)?\t+\s*(\d+)\s+([A-Za-z][A-Za-z ]*?)(?:\t(.*))?$'
+    )
+
+    current = None
+    buf = []
+    size = 0
+    truncated = False
+    last_time = None
+
+    def flush():
+        nonlocal current, size, truncated
+        record = None
+        if current is not None and current['command'] in ('Query', 'Execute'):
+            sql = ''.join(buf).strip()
+            if sql:
+                record = dict(current, sql=sql)
+                if truncated:
+                    record['truncated'] = True
+        current = None
+        buf.clear()
+        size = 0
+        truncated = False
+        return record
+
+    for line in lines:
+        if line is LOG_IDLE:
+            # mysqld 一次写完整个条目，追上文件末尾时即可提交，不必等下一个条目
+            record = flush()
+            if record:
+                yield record
+            continue
+
+        match = entry.match(line.rstrip('\r\n'))
+        if match or _is_mysqld_banner(line):
+            record = flush()
+            if record:
+                yield record
+            if not match:
+                continue
+            if match.group(1):
+                last_time = match.group(1)
+            current = {'time': last_time, 'thread_id': int(match.group(2)), 'command': match.group(3).strip()}
+            line = (match.group(4) or '') + '\n'
+        elif current is None:
+            continue
+
+        # 不匹配条目格式的行是上一条多行语句的延续
+        if size < max_statement_chars:
+            buf.append(line[:max_statement_chars - size])
+            size += len(line)
+        if size > max_statement_chars:
+            truncated = True
+
+    record = flush()
+    if record:
+        yield record
+
+def detect_log_format(lines, sample_size=50):
+    """根据前若干行判断日志格式，返回 (格式, 重新拼接后的行迭代器)"""
+    import itertools
+    import re
+    general_entry = re.compile(r'^(\d{4}-\d\d-\d\dT\S+|\d{6}\s+\d{1,2}:\d\d:\d\d)?\t+\s*\d+\s+[A-Za-z]')
+
+    lines = iter(lines)
+    head = []
+    log_format = None
+    for line in lines:
+        if line is LOG_IDLE:
+            # 已读内容还不足以判断格式，继续等待新内容
+            continue
+        head.append(line)
+        if line.startswith(('# Time:', '# User@Host:', '# Query_time:')) or \
+                re.match(r'SET\s+timestamp\s*=', line, re.IGNORECASE):
+            log_format = 'slow'
+        elif general_entry.match(line):
+            log_format = 'general'
+        if log_format or len(head) >= sample_size:
+            break
+
+    return log_format or 'slow', itertools.chain(head, lines)
+
+def collect_table_names(ast):
+    """收集AST中引用的表名"""
+    tables = []
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if node.get('type') == 'table_reference':
+            tables.append(node.get('table_name'))
+        stack.extend(node.get('children', []))
+    return tables
+
+def run_log_pipeline(records, emit, rollup_interval=None, queue_size=1000, level='full'):
+    """生产者/消费者流水线：读取线程把日志条目放入有界队列，主线程解析并输出
+
+    队列满时读取线程阻塞（背压），内存占用只与队列长度有关，与日志大小无关。
+    rollup_interval 为空时逐条输出解析结果，否则每隔 rollup_interval 秒输出一次汇总。
+    level 为解析的分析级别。
+    """
+    import queue
+    import threading
+    import time
+    from collections import Counter
+
+    done = object()
+    work = queue.Queue(maxsize=queue_size)
+
+    def produce():
+        try:
+            for record in records:
+                work.put(record)
+        except BaseException as e:
+            work.put(e)
+        finally:
+            work.put(done)
+
+    threading.Thread(target=produce, name='log-reader', daemon=True).start()
+
+    parser = SimpleSQLParser(level=level)
+    window = None
+
+    def new_window():
+        return {'start': time.time(), 'count': 0, 'query_time': 0.0, 'max_query_time': 0.0,
+                'rows_examined': 0, 'statements': Counter(), 'tables': Counter()}
+
+    def emit_rollup():
+        emit({
+            'type': 'rollup',
+            'window_start': window['start'],
+            'window_end': time.time(),
+            'count': window['count'],
+            'total_query_time': round(window['query_time'], 6),
+            'max_query_time': window['max_query_time'],
+            'rows_examined': window['rows_examined'],
+            'statement_types': dict(window['statements']),
+            'top_tables': dict(window['tables'].most_common(10)),
+        })
+
+    if rollup_interval:
+        window = new_window()
+
+    while True:
+        timeout = None
+        if window is not None:
+            timeout = max(0.0, window['start'] + rollup_interval - time.time())
+        try:
+            record = work.get(timeout=timeout)
+        except queue.Empty:
+            record = None
+
+        if record is done:
+            break
+        if isinstance(record, BaseException):
+            raise record
+
+        if record is not None:
+            ast = parser.parse(record['sql'])
+            if window is None:
+                emit(dict(record, ast=ast))
+            else:
+                window['count'] += 1
+                query_time = record.get('query_time', 0.0)
+                window['query_time'] += query_time
+                window['max_query_time'] = max(window['max_query_time'], query_time)
+                window['rows_examined'] += record.get('rows_examined', 0)
+                statement = ast['children'][0] if ast.get('type') == 'query_analysis' else ast
+                window['statements'][statement.get('type')] += 1
+                window['tables'].update(collect_table_names(statement))
+
+        if window is not None and time.time() >= window['start'] + rollup_interval:
+            emit_rollup()
+            window = new_window()
+
+    if window is not None and window['count']:
+        emit_rollup()
+
+def run_log_ingest(argv):
+    """log 子命令：读取慢查询日志/通用查询日志，输出 NDJSON"""
+    try:
+        options, paths = parse_cli_options(
+            argv,
+            value_options=('--format', '--rollup', '--queue-size', '--level'),
+            flag_options=('--follow',)
+        )
+        log_format = options.get('--format', 'auto')
+        rollup_interval = float(options['--rollup']) if '--rollup' in options else None
+        queue_size = int(options.get('--queue-size', 1000))
+        # 汇总只用到语句类型和表名，不输出 AST，默认只生成语法树
+        level = options.get('--level', 'ast' if rollup_interval else 'full')
+        if len(paths) != 1 or log_format not in ('auto', 'slow', 'general'):
+            raise ValueError("用法：python parse.py log <日志文件|-> [--format auto|slow|general] "
+                             "[--follow] [--rollup 秒] [--queue-size N] [--level tokens|ast|ast+plan|full]")
+        SimpleSQLParser.check_level(level)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    path = paths[0]
+    if path == '-':
+        lines = sys.stdin
+    else:
+        if not options.get('--follow') and not os.path.exists(path):
+            print(f"错误：找不到文件 {path}", file=sys.stderr)
+            sys.exit(1)
+        lines = follow_lines(path, follow=bool(options.get('--follow')))
+
+    if log_format == 'auto':
+        log_format, lines = detect_log_format(lines)
+    reader = iter_slow_log if log_format == 'slow' else iter_general_log
+
+    def emit(obj):
+        write_json(obj, sys.stdout.write, separators=(',', ':'), ensure_ascii=False)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+
+    try:
+        run_log_pipeline(reader(lines), emit, rollup_interval=rollup_interval, queue_size=queue_size, level=level)
+    except KeyboardInterrupt:
+        pass
+
+# 工作负载索引建议
+class IndexAdvisor:
+    """汇总整个查询语料中各表列的使用频次，推荐复合索引
+
+    每条语句只提取列的使用情况累加到计数器中，不保留AST；
+    内存占用只与不同的表、列和候选索引数量有关，与语句条数无关。
+    """
+
+    USAGE_KINDS = {'eq': '等值条件', 'range': '范围条件', 'join': '连接键', 'group': '分组列', 'order': '排序列'}
+    MAX_INDEX_COLUMNS = 5
+
+    def __init__(self, stats=None):
+        from collections import Counter
+        self.model = CostModel(stats or {'tables': {}})
+        self.usage = {}              # 表名 -> Counter((用途, 列名))
+        self.candidates = Counter()  # (表名, 列元组) -> 语句数
+        self.statements = 0
+        self.analyzed = 0
+
+    def add(self, analysis, weight=1):
+        """累加一条语句的分析结果"""
+        from collections import Counter
+        self.statements += weight
+        query = self.model.describe_query(analysis)
+        if query is None:
+            return
+        self.analyzed += weight
+
+        per_table = {}
+
+        def use(table, kind, column):
+            if table and column:
+                per_table.setdefault(table, {kind: [] for kind in self.USAGE_KINDS})[kind].append(column.lower())
+
+        for predicate in query['predicates']:
+            use(predicate['table'], 'range' if predicate['kind'] == 'range' else 'eq', predicate['column'])
+        # 连接键只记在被连接的内表上：外表按其它条件访问，内表才需要按连接列查找
+        for join in query['joins']:
+            _, inner_column = self.model.join_columns(join['condition'], join['table']['table_name'], query['aliases'])
+            if inner_column:
+                use(inner_column[0], 'join', inner_column[1])
+        sort_tables = set()
+        for kind, step_type in (('group', 'group_operation'), ('order', 'sort_operation')):
+            if step_type in query['steps']:
+                for qualifier, column in self.model.clause_columns(query['steps'][step_type]):
+                    table = self.model.resolve_table(qualifier, column, query['aliases'], query['table_order'])
+                    use(table, kind, column)
+                    sort_tables.add(table)
+
+        for table, used in per_table.items():
+            counter = self.usage.setdefault(table, Counter())
+            for kind, columns in used.items():
+                for column in set(columns):
+                    counter[(kind, column)] += weight
+            # 分组/排序列分布在多个表上时，单表索引无法消除排序
+            candidate = self.candidate_index(table, used, sortable=sort_tables == {table})
+            if candidate:
+                self.candidates[(table, candidate)] += weight
+
+    def candidate_index(self, table, used, sortable):
+        """为一条语句在某个表上构造候选复合索引：等值列在前，其后接一个范围列或排序列"""
+        columns = []
+        for column in used['eq'] + used['join']:
+            if column not in columns:
+                columns.append(column)
+        # 等值列之间按基数从高到低排列，区分度高的列放在前面
+        columns.sort(key=lambda column: -(self.model.cardinality(table, column) or 0))
+
+        if used['range']:
+            tail = used['range'][:1]
+        elif sortable:
+            tail = used['group'] or used['order']
+        else:
+            tail = []
+        for column in tail:
+            if column not in columns:
+                columns.append(column)
+        return tuple(columns[:self.MAX_INDEX_COLUMNS])
+
+    def existing_index(self, table, columns, prefix_of_candidate=False):
+        """查找已有索引：默认找能覆盖候选索引的，否则找可以扩展成候选的
+
+        覆盖指候选是已有索引的前缀，或已有唯一索引是候选的前缀：唯一索引的列都等值匹配时
+        最多只有一行，后面再补列没有意义。
+        """
+        info = self.model.tables.get(table.lower())
+        for index in (info['indexes'] if info else []):
+            existing = tuple(index['columns'])
+            if prefix_of_candidate:
+                if existing and columns[:len(existing)] == existing:
+                    return index
+            elif existing[:len(columns)] == columns:
+                return index
+            elif index['unique'] and existing and columns[:len(existing)] == existing:
+                return index
+        return None
+
+    def recommend(self, top=20):
+        """合并候选索引并给出推荐列表
+
+        一个候选是另一个的前缀时，较长的索引同时服务两类查询，两者合并；已有索引覆盖的候选不再推荐。
+        """
+        recommendations = []
+        covered = []
+        for (table, columns), count in self.candidates.most_common():
+            existing = self.existing_index(table, columns)
+            if existing:
+                covered.append({'table': table, 'columns': list(columns), 'queries': count, 'index': existing['name']})
+                continue
+            for recommendation in recommendations:
+                if recommendation['table'] != table:
+                    continue
+                current = recommendation['columns']
+                if current[:len(columns)] == columns:
+                    recommendation['queries'] += count
+                    break
+                if columns[:len(current)] == current:
+                    recommendation['columns'] = columns
+                    recommendation['queries'] += count
+                    break
+            else:
+                recommendations.append({'table': table, 'columns': columns, 'queries': count})
+
+        recommendations.sort(key=lambda item: -item['queries'])
+        result = []
+        for recommendation in recommendations[:top]:
+            table, columns = recommendation['table'], recommendation['columns']
+            name = 'idx_' + '_'.join((table,) + columns)
+            item = {
+                'table': table,
+                'columns': list(columns),
+                'queries': recommendation['queries'],
+                'sql': f"CREATE INDEX {name} ON {table} ({', '.join(columns)});",
+                'reasons': self.reasons(table, columns),
+            }
+            extends = self.existing_index(table, columns, prefix_of_candidate=True)
+            if extends:
+                item['extends'] = extends['name']
+            result.append(item)
+        return {'statements': self.statements, 'analyzed': self.analyzed,
+                'recommendations': result, 'covered_by_existing': covered[:top]}
+
+    def reasons(self, table, columns):
+        """列出索引中每一列在工作负载中的用途和次数"""
+        counter = self.usage.get(table, {})
+        reasons = []
+        for column in columns:
+            uses = [f"{label} {counter[(kind, column)]} 次"
+                    for kind, label in self.USAGE_KINDS.items() if counter.get((kind, column))]
+            reasons.append(f"{column}：{'，'.join(uses)}")
+        return reasons
+
+def iter_corpus_statements(paths, corpus_format='sql'):
+    """流式读取查询语料：SQL 文件按分号切分，日志文件复用慢查询/通用查询日志读取器"""
+    for path in paths:
+        if corpus_format == 'sql':
+            with open(path, 'r', encoding='utf-8') as f:
+                yield from iter_statements(f)
+            continue
+        lines = follow_lines(path, follow=False)
+        log_format = corpus_format
+        if log_format == 'auto':
+            log_format, lines = detect_log_format(lines)
+        reader = iter_slow_log if log_format == 'slow' else iter_general_log
+        for record in reader(lines):
+            yield record['sql']
+
+def run_index_advisor(argv):
+    """advise 子命令：从查询语料中统计列使用情况，推荐复合索引"""
+    try:
+        options, paths = parse_cli_options(
+            argv,
+            value_options=('--format', '--stats', '--top'),
+            flag_options=('--json',)
+        )
+        corpus_format = options.get('--format', 'sql')
+        top = int(options.get('--top', 20))
+        if not paths or corpus_format not in ('sql', 'auto', 'slow', 'general'):
+            raise ValueError("用法：python parse.py advise <语料文件...> [--format sql|auto|slow|general] "
+                             "[--stats 统计信息文件] [--top N] [--json]")
+        for path in paths:
+            if not os.path.exists(path):
+                raise ValueError(f"找不到文件 {path}")
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    advisor = IndexAdvisor(load_table_stats(options['--stats']) if '--stats' in options else None)
+    # 索引建议只需要语法树和执行计划，不需要说明文字和结构哈希
+    parser = SimpleSQLParser(level='ast+plan')
+    for count, statement in enumerate(iter_corpus_statements(paths, corpus_format), 1):
+        advisor.add(parser.parse(statement))
+        if count % 100000 == 0:
+            print(f"已分析 {count} 条语句...", file=sys.stderr)
+
+    report = advisor.recommend(top)
+    if options.get('--json'):
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"共分析 {report['statements']} 条语句，其中 {report['analyzed']} 条 SELECT")
+    if not report['recommendations']:
+        print("没有需要新增的索引")
+    for i, item in enumerate(report['recommendations'], 1):
+        print(f"\n{i}. {item['sql']}")
+        print(f"   受益语句：{item['queries']} 条")
+        if item.get('extends'):
+            print(f"   可由已有索引 {item['extends']} 扩展而来")
+        for reason in item['reasons']:
+            print(f"   - {reason}")
+    if report['covered_by_existing']:
+        print("\n已被现有索引覆盖的访问模式：")
+        for item in report['covered_by_existing']:
+            print(f"   - {item['table']} ({', '.join(item['columns'])})：{item['queries']} 条，索引 {item['index']}")
+
+DEDUPE_LITERAL_TOKENS = ('STRING', 'INTEGER', 'DECIMAL')
+
+def statement_text_hash(tokens, shape=False):
+    """按规范化的词法单元序列计算语句哈希（关键字统一大写，shape=True 时字面量记为 ?）
+
+    用于解析器只生成占位节点的语句（INSERT、UPDATE 等），这些语句的 AST 不含内容，不能按结构区分。
+    """
+    import hashlib
+    text = ' '.join([
+        '?' if shape and token['type'] in DEDUPE_LITERAL_TOKENS
+        else token['value'] if token['type'] in ('IDENTIFIER', 'BACKTICK_IDENTIFIER', *DEDUPE_LITERAL_TOKENS)
+        else token['value'].upper()
+        for token in tokens
+    ])
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=NODE_HASH_BYTES).hexdigest()
+
+def run_dedupe(argv):
+    """dedupe 子命令：按结构哈希把语料中结构相同的语句分组
+
+    解析器只建模 SELECT；其余语句按规范化文本分组，并在结果中标记为未解析（parsed 为 False）。
+    """
+    try:
+        options, paths = parse_cli_options(
+            argv,
+            value_options=('--format', '--top'),
+            flag_options=('--shape', '--json')
+        )
+        corpus_format = options.get('--format', 'sql')
+        top = int(options.get('--top', 20))
+        if not paths or corpus_format not in ('sql', 'auto', 'slow', 'general'):
+            raise ValueError("用法：python parse.py dedupe <语料文件...> [--format sql|auto|slow|general] "
+                             "[--shape] [--top N] [--json]")
+        for path in paths:
+            if not os.path.exists(path):
+                raise ValueError(f"找不到文件 {path}")
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 每组只保留计数和第一条语句，内存只与不同结构的数量有关
+    shape = bool(options.get('--shape'))
+    # 执行计划由语法树推出，只对语法树计算哈希即可区分结构，不需要 full 级别的计划和说明文字
+    parser = SimpleSQLParser(level='ast')
+    groups = {}
+    total = 0
+    for total, statement in enumerate(iter_corpus_statements(paths, corpus_format), 1):
+        ast = parser.parse(statement)
+        parsed = ast['type'] == 'select_statement'
+        if parsed:
+            key = compute_node_hashes(ast, shape=shape)
+        else:
+            key = statement_text_hash(parser.tokens, shape=shape)
+        group = groups.get((parsed, key))
+        if group is None:
+            groups[(parsed, key)] = {'hash': key, 'parsed': parsed, 'count': 1, 'sql': statement.strip()}
+        else:
+            group['count'] += 1
+        if total % 100000 == 0:
+            print(f"已分析 {total} 条语句...", file=sys.stderr)
+
+    ranked = sorted(groups.values(), key=lambda group: -group['count'])[:top]
+    if options.get('--json'):
+        print(json.dumps({'statements': total, 'distinct': len(groups), 'groups': ranked},
+                         ensure_ascii=False, indent=2))
+        return
+
+    print(f"共 {total} 条语句，{len(groups)} 种不同{'形状' if shape else '结构'}")
+    for i, group in enumerate(ranked, 1):
+        sql = ' '.join(group['sql'].split())
+        if len(sql) > 120:
+            sql = sql[:117] + '...'
+        note = '' if group['parsed'] else '（未解析，按文本分组）'
+        print(f"{i}. [{group['hash']}] {group['count']} 条{note}  {sql}")
+
+def _describe_node(node):
+    """变更输出中节点的简短描述"""
+    if node is None:
+        return ''
+    label = node.get('type', 'unknown')
+    if 'table' in node and 'column' in node:
+        return f"{label} {node['table']}.{node['column']}"
+    for key in ('value', 'operator', 'column_name', 'table_name'):
+        if key in node:
+            return f"{label} {node[key]}"
+    return label
+
+def run_diff(argv):
+    """diff 子命令：比较两个 SQL 文件中语句的结构差异"""
+    if len(argv) != 2 or not all(os.path.exists(path) for path in argv):
+        print("用法：python parse.py diff <旧SQL文件> <新SQL文件>", file=sys.stderr)
+        sys.exit(1)
+
+    # 只比较语法树：full 级别的执行计划与 AST 共享子句节点，同一处变化会被报告两次
+    parser = SimpleSQLParser(level='ast')
+    asts = []
+    for path in argv:
+        with open(path, 'r', encoding='utf-8') as f:
+            asts.append(make_script_node([parser.parse(statement) for statement in iter_statements(f)]))
+
+    changes = diff_ast(*asts)
+    if not changes:
+        print("结构相同")
+        return
+    for change in changes:
+        path = '/'.join(map(str, change['new_path'] if change['new_path'] is not None else change['old_path']))
+        old_label = _describe_node(change['old'])
+        new_label = _describe_node(change['new'])
+        if change['op'] == 'insert':
+            print(f"+ /{path}  {new_label}")
+        elif change['op'] == 'delete':
+            print(f"- /{path}  {old_label}")
+        else:
+            print(f"~ /{path}  {old_label} -> {new_label}")
+
+def run_bench(argv):
+    """bench 子命令：在同一批语句上测量各分析级别的解析吞吐量"""
+    import time
+    try:
+        options, paths = parse_cli_options(argv, value_options=('--format', '--repeat', '--level'))
+        corpus_format = options.get('--format', 'sql')
+        repeat = int(options.get('--repeat', 3))
+        levels = options['--level'].split(',') if '--level' in options else list(SimpleSQLParser.ANALYSIS_LEVELS)
+        paths = paths or ['input.sql']
+        if corpus_format not in ('sql', 'auto', 'slow', 'general') or repeat < 1:
+            raise ValueError("用法：python parse.py bench [SQL文件...] [--format sql|auto|slow|general] "
+                             "[--repeat N] [--level tokens,ast,ast+plan,full]")
+        for level in levels:
+            SimpleSQLParser.check_level(level)
+        for path in paths:
+            if not os.path.exists(path):
+                raise ValueError(f"找不到文件 {path}")
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 先把语句读入内存，计时只包含解析本身
+    statements = list(iter_corpus_statements(paths, corpus_format))
+    if not statements:
+        print("错误：没有可解析的语句", file=sys.stderr)
+        sys.exit(1)
+    total_bytes = sum(len(statement.encode('utf-8')) for statement in statements)
+    print(f"共 {len(statements)} 条语句（{total_bytes / 1024:.1f} KB），每个级别重复 {repeat} 次取最快一次")
+
+    timings = {}
+    for level in levels:
+        parser = SimpleSQLParser(level=level)
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for statement in statements:
+                parser.parse(statement)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[level] = best
+
+    baseline = timings.get('full')
+    print(f"{'level':<10}{'stmts/s':>12}{'MB/s':>10}{'us/stmt':>10}{'vs full':>10}")
+    for level, elapsed in timings.items():
+        speedup = f"{baseline / elapsed:.2f}x" if baseline else '-'
+        print(f"{level:<10}{len(statements) / elapsed:>12.0f}{total_bytes / elapsed / 1e6:>10.2f}"
+              f"{elapsed / len(statements) * 1e6:>10.1f}{speedup:>10}")
+
 if __name__ == "__main__":
-    import sys
-    
     if len(sys.argv) > 1 and sys.argv[1] == 'server':
         # 启动服务器模式
-        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8001
-        start_server(port)
+        run_server(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        # 常驻解析进程模式
+        run_daemon(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'log':
+        # 慢查询日志 / 通用查询日志流式解析
+        run_log_ingest(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'advise':
+        # 工作负载索引建议
+        run_index_advisor(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'dedupe':
+        # 按结构哈希对语料去重
+        run_dedupe(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'diff':
+        # 比较两个版本查询的结构差异
+        run_diff(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        # 各分析级别的解析吞吐量
+        run_bench(sys.argv[2:])
     else:
         # 原有的文件解析模式
-        main()
\ No newline at end of file
+        main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL AST 解析守护进程的轻量客户端
+只依赖 os/sys/_socket，把 SQL 发送给 `python parse.py daemon`，并把返回的 JSON 写到标准输出
+
+用法：python -S parse_client.py [SQL文件 | -] [--socket 套接字路径]
+（-S 跳过 site 初始化，进一步缩短脚本循环中的启动时间）
+"""
+
+import os
+import sys
+# 直接使用 C 扩展 _socket：socket 模块会连带导入 selectors/enum 等，在脚本循环中白白多出约 10ms
+import _socket
+
+DEFAULT_DAEMON_SOCKET = os.environ.get('SQL_AST_SOCKET', '/tmp/sql-ast-visualizer.sock')
+
+def request(sql_bytes, socket_path=DEFAULT_DAEMON_SOCKET):
+    """发送SQL并读取完整响应"""
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(sql_bytes)
+        sock.shutdown(_socket.SHUT_WR)
+
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return b''.join(chunks)
+
+def main(argv):
+    socket_path = DEFAULT_DAEMON_SOCKET
+    source = '-'
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '--socket' and args:
+            socket_path = args.pop(0)
+        elif arg.startswith('--socket='):
+            socket_path = arg.split('=', 1)[1]
+        else:
+            source = arg
+
+    if source == '-':
+        sql_bytes = sys.stdin.buffer.read()
+    else:
+        with open(source, 'rb') as f:
+            sql_bytes = f.read()
+
+    try:
+        response = request(sql_bytes, socket_path)
+    except OSError as e:
+        sys.stderr.write(f"错误：无法连接解析守护进程 {socket_path}（{e}），请先运行 python parse.py daemon\n")
+        return 1
+
+    if not response:
+        sys.stderr.write("错误：解析守护进程没有返回结果\n")
+        return 1
+    sys.stdout.buffer.write(response)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))